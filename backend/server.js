@@ -48,12 +48,101 @@ app.post('/get-matches', async (req, res) => {
         }
 
         const { mostSimilar, leastSimilar } = await findSimilarImages(descriptor, numVids, path.join('database'));
-        res.json({ mostSimilar, leastSimilar });
+        res.json({ mostSimilar, leastSimilar, descriptor: Array.from(descriptor) });
     } catch (error) {
         console.error('Unexpected error processing image:', error);
         res.status(500).json({ error: 'Internal server error' });
     }
 });
+
+// Route to receive imageDataURL and return only the descriptor, for frontends that match locally
+app.post('/get-descriptor', async (req, res) => {
+    try {
+        const { image } = req.body;
+
+        if (!image) {
+            return res.status(400).json({ error: 'No image data provided' });
+        }
+
+        const descriptor = await getDescriptor(image);
+        if (!descriptor) {
+            return res.status(404).json({ error: 'No face detected' });
+        }
+
+        res.json({ descriptor: Array.from(descriptor) });
+    } catch (error) {
+        console.error('Unexpected error processing image:', error);
+        res.status(500).json({ error: 'Internal server error' });
+    }
+});
+
+// Mean of the descriptors, scaled back to their average length so it sits at the same distance
+// scale as a single-frame descriptor instead of shrinking towards the origin
+function fuseDescriptors(descriptors) {
+    const fused = new Float32Array(descriptors[0].length);
+    let meanNorm = 0;
+    descriptors.forEach(descriptor => {
+        let norm = 0;
+        for (let i = 0; i < descriptor.length; i++) {
+            fused[i] += descriptor[i] / descriptors.length;
+            norm += descriptor[i] * descriptor[i];
+        }
+        meanNorm += Math.sqrt(norm) / descriptors.length;
+    });
+    let fusedNorm = 0;
+    for (let i = 0; i < fused.length; i++) {
+        fusedNorm += fused[i] * fused[i];
+    }
+    fusedNorm = Math.sqrt(fusedNorm);
+    if (fusedNorm > 0) {
+        for (let i = 0; i < fused.length; i++) {
+            fused[i] *= meanNorm / fusedNorm;
+        }
+    }
+    return fused;
+}
+
+// Route to receive several imageDataURLs of the same visitor and match on their fused descriptor,
+// one odd frame then moves the result much less than when it is the only one
+app.post('/get-matches-batch', async (req, res) => {
+    try {
+        const { images, numVids, descriptorOnly } = req.body;
+
+        if (!descriptorOnly && !numVids) {
+            return res.status(400).json({ error: 'Number of videos in grid not provided' });
+        }
+
+        if (!Array.isArray(images) || images.length === 0) {
+            return res.status(400).json({ error: 'No image data provided' });
+        }
+
+        // One at a time, the models share a single TensorFlow backend
+        const descriptors = [];
+        for (const image of images) {
+            descriptors.push(await getDescriptor(image));
+        }
+        const found = descriptors.filter(descriptor => descriptor);
+        if (found.length === 0) {
+            return res.status(404).json({ error: 'No face detected' });
+        }
+
+        const descriptor = fuseDescriptors(found);
+        const result = {
+            descriptor: Array.from(descriptor),
+            descriptors: descriptors.map(d => d ? Array.from(d) : null),
+            used: found.length,
+        };
+        if (!descriptorOnly) {
+            const { mostSimilar, leastSimilar } = await findSimilarImages(descriptor, numVids, path.join('database'));
+            result.mostSimilar = mostSimilar;
+            result.leastSimilar = leastSimilar;
+        }
+        res.json(result);
+    } catch (error) {
+        console.error('Unexpected error processing images:', error);
+        res.status(500).json({ error: 'Internal server error' });
+    }
+});
 const upload = multer({ storage: multer.memoryStorage() });
 app.post('/create-spritesheet', upload.array('frames'), async (req, res) => {
     try {
@@ -0,0 +1,155 @@
+import os
+import numpy as np
+from logger_setup import logger
+
+DEFAULT_NPROBE = 8  # Lists searched per query, more means better recall and slower queries
+DEFAULT_FAR_NPROBE = 64  # Farthest members are spread over more lists than nearest ones
+KMEANS_ITERATIONS = 10
+TRAIN_SAMPLE = 50000  # Rows k-means is trained on, the rest are only assigned
+ASSIGN_BATCH = 8192  # Rows per distance matrix when assigning, bounds memory to BATCH x lists
+
+
+def row_norms(vectors):
+    return np.einsum('ij,ij->i', vectors, vectors)
+
+
+def default_list_count(count):
+    return int(np.clip(4 * np.sqrt(count), 1, count))
+
+
+def kmeans(vectors, n_lists, iterations=KMEANS_ITERATIONS, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_lists, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = nearest_lists(vectors, centroids)
+        order = np.argsort(assignment, kind='stable')
+        counts = np.bincount(assignment, minlength=n_lists)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        sums = np.add.reduceat(vectors[order], starts[filled], axis=0)
+        centroids[filled] = sums / counts[filled, None]
+        # Lists nobody was assigned to restart on random rows
+        if not filled.all():
+            centroids[~filled] = vectors[rng.choice(len(vectors), int((~filled).sum()), replace=False)]
+    return centroids
+
+
+def nearest_lists(vectors, centroids):
+    centroid_norms = row_norms(centroids)
+    assignment = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        batch = vectors[start:start + ASSIGN_BATCH]
+        # |x|^2 is the same for every list, only the rest decides the nearest one
+        assignment[start:start + len(batch)] = np.argmin(centroid_norms[None, :] - 2.0 * batch @ centroids.T, axis=1)
+    return assignment
+
+
+class IVFIndex:
+    # Inverted file index: k-means splits the descriptors into lists and a query only scans the
+    # few lists nearest to it. Farthest queries scan the lists most likely to hold far members,
+    # so both the mostSimilar and leastSimilar sides come from the same index.
+    def __init__(self, centroids):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.dim = self.centroids.shape[1]
+        n_lists = len(self.centroids)
+        self.list_ids = [np.zeros(0, dtype=np.int64) for _ in range(n_lists)]
+        self.list_vectors = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(n_lists)]
+        self.radii = np.zeros(n_lists, dtype=np.float32)  # Distance from each centroid to its farthest member
+
+    @classmethod
+    def train(cls, vectors, ids=None, n_lists=None, iterations=KMEANS_ITERATIONS, seed=0):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n_lists = n_lists or default_list_count(len(vectors))
+        sample = vectors
+        if len(vectors) > TRAIN_SAMPLE:
+            sample = vectors[np.random.default_rng(seed).choice(len(vectors), TRAIN_SAMPLE, replace=False)]
+        index = cls(kmeans(sample, n_lists, iterations, seed))
+        index.add(vectors, np.arange(len(vectors)) if ids is None else ids)
+        return index
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.list_ids)
+
+    def add(self, vectors, ids):
+        # New descriptors join their nearest list, the centroids themselves stay as trained
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        ids = np.asarray(ids, dtype=np.int64).reshape(-1)
+        assignment = nearest_lists(vectors, self.centroids)
+        for list_no in np.unique(assignment):
+            members = assignment == list_no
+            self.list_ids[list_no] = np.concatenate([self.list_ids[list_no], ids[members]])
+            self.list_vectors[list_no] = np.vstack([self.list_vectors[list_no], vectors[members]])
+            radius = np.sqrt(row_norms(vectors[members] - self.centroids[list_no]).max())
+            self.radii[list_no] = max(self.radii[list_no], radius)
+
+    def remove(self, keep):
+        # Drops every id for which keep(ids) is False, keep works on a whole id array at once
+        for list_no, ids in enumerate(self.list_ids):
+            mask = keep(ids)
+            self.list_ids[list_no] = ids[mask]
+            self.list_vectors[list_no] = self.list_vectors[list_no][mask]
+
+    def probe_order(self, query, farthest):
+        centroid_distances = row_norms(self.centroids - query)
+        if farthest:
+            # Squared distance of a list's outermost member if it sat at right angles to the query
+            # direction. Tighter than centroid distance plus radius, which one outlier can inflate.
+            return np.argsort(-(centroid_distances + self.radii ** 2))
+        return np.argsort(centroid_distances)
+
+    def search(self, query, k, nprobe=DEFAULT_NPROBE, farthest=False):
+        # Returns up to k ids ordered nearest (or farthest) first, with their squared distances
+        query = np.asarray(query, dtype=np.float32).reshape(-1)
+        probed, found = [], 0
+        for list_no in self.probe_order(query, farthest):
+            if len(probed) >= nprobe and found >= k:
+                break
+            if len(self.list_ids[list_no]):
+                probed.append(list_no)
+                found += len(self.list_ids[list_no])
+        if not probed:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+
+        ids = np.concatenate([self.list_ids[i] for i in probed])
+        vectors = np.concatenate([self.list_vectors[i] for i in probed])
+        distances = row_norms(vectors - query)
+        scores = -distances if farthest else distances
+        if k < len(ids):
+            top = np.argpartition(scores, k - 1)[:k]
+        else:
+            top = np.arange(len(ids))
+        top = top[np.argsort(scores[top])]
+        return ids[top], distances[top]
+
+    def save(self, path, labels=None):
+        # Written next to the target and moved into place, a crash never leaves half an index behind
+        sizes = np.array([len(ids) for ids in self.list_ids], dtype=np.int64)
+        arrays = {
+            'centroids': self.centroids,
+            'radii': self.radii,
+            'sizes': sizes,
+            'ids': np.concatenate(self.list_ids) if len(sizes) else np.zeros(0, dtype=np.int64),
+            'vectors': np.vstack(self.list_vectors) if len(sizes) else np.zeros((0, self.dim), dtype=np.float32),
+        }
+        if labels is not None:
+            arrays['labels'] = np.asarray(labels)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as index_file:
+            np.savez(index_file, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        # Returns (index, labels), labels is None when the index was saved without them
+        try:
+            with np.load(path) as data:
+                index = cls(data['centroids'])
+                index.radii = data['radii'].astype(np.float32)
+                bounds = np.cumsum(data['sizes'])[:-1]
+                index.list_ids = np.split(data['ids'], bounds)
+                index.list_vectors = np.split(data['vectors'], bounds)
+                labels = data['labels'] if 'labels' in data.files else None
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Could not load ANN index from {path}: {e}")
+            return None, None
+        return index, labels
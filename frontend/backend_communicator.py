@@ -1,14 +1,28 @@
 import json
 import cv2
 import numpy as np
-import requests
 import base64
 import config
 from logger_setup import logger
 import httpx
 import asyncio
-import os 
+import os
+import threading
+from collections import Counter
+from descriptor_index import descriptor_index
+from descriptor_store import FACEAPI_SPACE
+from embedder import fuse_descriptors
+from match_cache import match_cache
 BASE_SERVER_URL = "http://localhost:3000"
+GRID_NUM_VIDS = 231  # The 21 x 11 grid ImageApp lays out on a 1920x1080 screen, for tools that run without it
+
+# Outcome counts for /get-matches, read by the snapshot selection stats
+snapshot_stats = Counter()
+snapshot_stats_lock = threading.Lock()
+
+def count_snapshot(outcome):
+    with snapshot_stats_lock:
+        snapshot_stats[outcome] += 1
 
 def convert_image_to_data_url(image):
     if image is None:
@@ -20,42 +34,167 @@ def convert_image_to_data_url(image):
     data_url = f"data:image/jpeg;base64,{jpg_as_text}"
     return data_url
 
-def send_snapshot_to_server(frame, callback):
+class CancelToken:
+    # Lets another thread abort a request that is queued or already on the wire
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.cancelled = False
+        self.loop = None
+        self.task = None
+
+    def attach(self, loop, task):
+        with self.lock:
+            self.loop = loop
+            self.task = task
+            if self.cancelled:
+                task.cancel()
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled = True
+            if self.loop is not None and self.task is not None and not self.loop.is_closed():
+                self.loop.call_soon_threadsafe(self.task.cancel)
+
+def run_cancellable(coro, cancel_token=None):
+    async def runner():
+        task = asyncio.ensure_future(coro)
+        if cancel_token is not None:
+            cancel_token.attach(asyncio.get_running_loop(), task)
+        return await task
+
+    return asyncio.run(runner())
+
+async def post_snapshot(url, payload):
+    async with httpx.AsyncClient(timeout=None) as client:
+        response = await client.post(url, json=payload)
+    if response.status_code == 200:
+        count_snapshot('ok')
+        result = response.json()
+        most_similar = result.get('mostSimilar')
+        least_similar = result.get('leastSimilar')
+
+        if most_similar is None or least_similar is None:
+            logger.error("Received None for most_similar or least_similar")
+            return None, None, False, None
+
+        return most_similar, least_similar, True, result.get('descriptor')
+    else:
+        count_failed_response(response)
+        return None, None, False, None
+
+async def match_locally(url, payload):
+    # The server only computes the descriptor, the nearest and farthest faces come from the local index
+    async with httpx.AsyncClient(timeout=None) as client:
+        response = await client.post(url, json=payload)
+    if response.status_code != 200:
+        count_failed_response(response)
+        return None, None, False, None
+
+    descriptor = response.json().get('descriptor')
+    if descriptor is None:
+        logger.error("Received no descriptor from server")
+        count_snapshot('error')
+        return None, None, False, None
+
+    count_snapshot('ok')
+    cached = match_cache.get(descriptor=descriptor)
+    if cached is not None:
+        count_snapshot('cached')
+        return cached.most_similar, cached.least_similar, True, descriptor
+
+    most_similar, least_similar = descriptor_index.search(descriptor, config.num_vids)
+    count_snapshot('local')
+    return most_similar, least_similar, True, descriptor
+
+def count_failed_response(response):
+    logger.error(f"Failed to get matches from server: {response.status_code}")
+    logger.error(f"Server response: {response.text}")
+    if response.status_code == 404 and "No face detected" in response.text:
+        count_snapshot('no_face')
+    else:
+        count_snapshot('error')
+
+def send_snapshot_to_server(frame, cancel_token=None, crops=()):
+    # crops are several face crops of the same visitor, best first. When given they go to the server
+    # in place of frame and are fused into one descriptor there.
     if frame is None:
         logger.error("send_snapshot_to_server: frame is None")
-        return None, None, False
+        return None, None, False, None
+
+    if cancel_token is not None and cancel_token.cancelled:
+        return None, None, False, None
 
     image_data_url = convert_image_to_data_url(frame)
     if image_data_url is None:
         logger.error("send_snapshot_to_server: Failed to convert frame to data URL")
-        return None, None, False
+        return None, None, False, None
 
-    payload = {'image': image_data_url, 'numVids': config.num_vids}
-    url = f"{BASE_SERVER_URL}/get-matches"
+    # The index only answers face-api descriptors when it holds face-api rows
+    match_local = config.local_matching and descriptor_index.ready and descriptor_index.space == FACEAPI_SPACE
+    if crops:
+        images = [convert_image_to_data_url(crop) for crop in crops]
+        url = f"{BASE_SERVER_URL}/get-matches-batch"
+        count_snapshot('batched')
+        if match_local:
+            request = match_locally(url, {'images': images, 'descriptorOnly': True})
+        else:
+            request = post_snapshot(url, {'images': images, 'numVids': config.num_vids})
+    elif match_local:
+        request = match_locally(f"{BASE_SERVER_URL}/get-descriptor", {'image': image_data_url})
+    else:
+        payload = {'image': image_data_url, 'numVids': config.num_vids}
+        request = post_snapshot(f"{BASE_SERVER_URL}/get-matches", payload)
 
+    count_snapshot('sent')
     try:
-        response = requests.post(url, json=payload)
-        if response.status_code == 200:
-            result = response.json()
-            most_similar = result.get('mostSimilar')
-            least_similar = result.get('leastSimilar')
-
-            if most_similar is None or least_similar is None:
-                logger.error("Received None for most_similar or least_similar")
-                return None, None, False
-
-            # Call the callback function with the results
-            callback(most_similar, least_similar)
-            return most_similar, least_similar, True
-        else:
-            logger.error(f"Failed to get matches from server: {response.status_code}")
-            logger.error(f"Server response: {response.text}")
-            if response.status_code == 404 and "No face detected" in response.text:
-                return None, None, False
+        return run_cancellable(request, cancel_token)
+    except asyncio.CancelledError:
+        count_snapshot('cancelled')
+        logger.info("Snapshot request cancelled")
     except Exception as e:
+        count_snapshot('error')
         logger.exception("Error sending snapshot to server: %s", e)
 
-    return None, None, False
+    return None, None, False, None
+
+def batch_crops(cropped_faces):
+    # A single shot goes out as the full frame like before, several as their crops
+    return cropped_faces if len(cropped_faces) > 1 else ()
+
+def match_face(frames, cropped_faces, cancel_token=None):
+    # Fully in-process with a local embedder, the crops' fused descriptor against the index in the
+    # same space. The backend stays the fallback until the index has loaded or when embedding fails.
+    # frames and cropped_faces hold one or more shots of the same visitor, best first.
+    embedder = descriptor_index.embedder
+    if embedder is None or not descriptor_index.ready:
+        most_similar, least_similar, success, descriptor = send_snapshot_to_server(frames[0], cancel_token, batch_crops(cropped_faces))
+        # A face-api descriptor is no key for a cache of descriptors from the local model
+        return most_similar, least_similar, success, descriptor if embedder is None else None
+
+    if cancel_token is not None and cancel_token.cancelled:
+        return None, None, False, None
+
+    count_snapshot('sent')
+    try:
+        descriptor = fuse_descriptors([d for d in (embedder.embed(face) for face in cropped_faces) if d is not None])
+    except cv2.error as e:
+        logger.error(f"Local embedding failed, matching on the server: {e}")
+        count_snapshot('embed_failed')
+        most_similar, least_similar, success, _ = send_snapshot_to_server(frames[0], cancel_token, batch_crops(cropped_faces))
+        return most_similar, least_similar, success, None
+    if descriptor is None:
+        count_snapshot('error')
+        return None, None, False, None
+
+    count_snapshot('ok')
+    cached = match_cache.get(descriptor=descriptor)
+    if cached is not None:
+        count_snapshot('cached')
+        return cached.most_similar, cached.least_similar, True, descriptor
+
+    most_similar, least_similar = descriptor_index.search(descriptor, config.num_vids)
+    count_snapshot('embedded')
+    return most_similar, least_similar, True, descriptor
 
 def load_frames(frame_paths):
     frames = []
@@ -0,0 +1,164 @@
+import threading
+import time
+from concurrent.futures import Future
+from collections import deque
+from logger_setup import logger
+
+# Lanes are checked in priority order (lower number first). Each lane has its own
+# concurrency limit, and the shared worker pool is larger than the bulk lane's limit,
+# so a long spritesheet upload can never occupy the worker an interactive match needs.
+INTERACTIVE = 'interactive'
+BULK = 'bulk'
+
+
+class Lane:
+    def __init__(self, name, priority, max_concurrency, max_queued=None):
+        self.name = name
+        self.priority = priority
+        self.max_concurrency = max_concurrency
+        self.max_queued = max_queued  # Waiting jobs kept, the oldest is dropped for a new one beyond this
+        self.queue = deque()
+        self.running = 0
+
+        # Metrics
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.dropped = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    def stats(self):
+        started = self.completed + self.failed
+        return {
+            'queue_depth': len(self.queue),
+            'max_queue_depth': self.max_queue_depth,
+            'running': self.running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'failed': self.failed,
+            'cancelled': self.cancelled,
+            'dropped': self.dropped,
+            'avg_wait': self.total_wait / started if started else 0.0,
+            'max_wait': self.max_wait,
+            'avg_run': self.total_run / started if started else 0.0,
+        }
+
+
+class BackendScheduler:
+    def __init__(self, max_workers=3):
+        self.max_workers = max_workers
+        self.lanes = {}
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.workers = []
+
+    def add_lane(self, name, priority, max_concurrency, max_queued=None):
+        with self.condition:
+            self.lanes[name] = Lane(name, priority, max_concurrency, max_queued)
+
+    def start(self):
+        for i in range(self.max_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'backend-worker-{i}', daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, lane_name, fn, *args, **kwargs):
+        future = Future()
+        with self.condition:
+            if self.stopped:
+                future.cancel()
+                future.set_running_or_notify_cancel()
+                return future
+            lane = self.lanes[lane_name]
+            if lane.max_queued is not None and len(lane.queue) >= lane.max_queued:
+                # Newer work is worth more than a backlog that would only grow, e.g. uploads behind a slow server
+                dropped = lane.queue.popleft()[0]
+                dropped.cancel()
+                lane.dropped += 1
+                logger.warning(f"Backend lane '{lane.name}' full ({lane.max_queued} queued), dropped its oldest job")
+            lane.queue.append((future, fn, args, kwargs, time.time()))
+            lane.submitted += 1
+            lane.max_queue_depth = max(lane.max_queue_depth, len(lane.queue))
+            self.condition.notify()
+        return future
+
+    def queue_depth(self, lane_name):
+        with self.condition:
+            return len(self.lanes[lane_name].queue)
+
+    def _next_job(self):
+        # Called with the condition held
+        for lane in sorted(self.lanes.values(), key=lambda l: l.priority):
+            while lane.queue and lane.running < lane.max_concurrency:
+                future, fn, args, kwargs, submitted_at = lane.queue.popleft()
+                if not future.set_running_or_notify_cancel():
+                    lane.cancelled += 1
+                    continue
+                lane.running += 1
+                return lane, future, fn, args, kwargs, submitted_at
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self.condition:
+                job = self._next_job()
+                while job is None and not self.stopped:
+                    self.condition.wait()
+                    job = self._next_job()
+                if job is None:
+                    return
+
+            lane, future, fn, args, kwargs, submitted_at = job
+            started_at = time.time()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                logger.exception(f"Backend task in lane '{lane.name}' failed: {e}")
+                error = e
+                result = None
+            else:
+                error = None
+            finished_at = time.time()
+
+            with self.condition:
+                lane.running -= 1
+                wait = started_at - submitted_at
+                lane.total_wait += wait
+                lane.max_wait = max(lane.max_wait, wait)
+                lane.total_run += finished_at - started_at
+                if error is None:
+                    lane.completed += 1
+                else:
+                    lane.failed += 1
+                # A lane slot freed up, another worker may now be able to take a job
+                self.condition.notify_all()
+
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def stats(self):
+        with self.condition:
+            return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def log_stats(self):
+        for name, lane_stats in self.stats().items():
+            logger.info(f"Backend lane '{name}': depth={lane_stats['queue_depth']} (max {lane_stats['max_queue_depth']}), "
+                        f"running={lane_stats['running']}, done={lane_stats['completed']}, failed={lane_stats['failed']}, "
+                        f"cancelled={lane_stats['cancelled']}, dropped={lane_stats['dropped']}, avg wait={lane_stats['avg_wait'] * 1000:.1f} ms, "
+                        f"max wait={lane_stats['max_wait'] * 1000:.1f} ms")
+
+    def shutdown(self):
+        with self.condition:
+            self.stopped = True
+            for lane in self.lanes.values():
+                while lane.queue:
+                    future = lane.queue.popleft()[0]
+                    if future.cancel():
+                        lane.cancelled += 1
+            self.condition.notify_all()
@@ -0,0 +1,63 @@
+import cv2
+from frame_views import as_frame
+
+TRACK_WIDTH = 320  # Tracking runs on a small grayscale copy of the frame
+MIN_TEMPLATE_SIZE = 8
+
+
+class TemplateTracker:
+    # Follows one face between full detections by template matching the face region in a
+    # search window around its last position. Size stays fixed until the next detection.
+    def __init__(self, track_width=TRACK_WIDTH, search_margin=0.5):
+        self.track_width = track_width
+        self.search_margin = search_margin
+        self.template = None
+        self.bbox_small = None
+        self.confidence = 0.0
+
+    @property
+    def active(self):
+        return self.template is not None
+
+    def prepare(self, frame):
+        frame = as_frame(frame)
+        return frame.gray(self.track_width), frame.scale_for(self.track_width)
+
+    def init(self, frame, bbox):
+        gray, scale = self.prepare(frame)
+        gh, gw = gray.shape
+        x, y, w, h = (int(round(v * scale)) for v in bbox)
+        x, y = max(0, x), max(0, y)
+        w, h = min(w, gw - x), min(h, gh - y)
+        if w < MIN_TEMPLATE_SIZE or h < MIN_TEMPLATE_SIZE:
+            self.reset()
+            return
+        self.template = gray[y:y + h, x:x + w].copy()
+        self.bbox_small = (x, y, w, h)
+        self.confidence = 1.0
+
+    def track(self, frame):
+        if not self.active:
+            return None, 0.0
+        gray, scale = self.prepare(frame)
+        gh, gw = gray.shape
+        x, y, w, h = self.bbox_small
+        margin = int(max(w, h) * self.search_margin)
+        x0, y0 = max(0, x - margin), max(0, y - margin)
+        x1, y1 = min(gw, x + w + margin), min(gh, y + h + margin)
+        if x1 - x0 < w or y1 - y0 < h:
+            self.reset()
+            return None, 0.0
+
+        response = cv2.matchTemplate(gray[y0:y1, x0:x1], self.template, cv2.TM_CCOEFF_NORMED)
+        _, max_val, _, max_loc = cv2.minMaxLoc(response)
+        x, y = x0 + max_loc[0], y0 + max_loc[1]
+        self.bbox_small = (x, y, w, h)
+        self.confidence = float(max_val)
+        bbox = (int(x / scale), int(y / scale), int(w / scale), int(h / scale))
+        return bbox, self.confidence
+
+    def reset(self):
+        self.template = None
+        self.bbox_small = None
+        self.confidence = 0.0
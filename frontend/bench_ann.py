@@ -0,0 +1,79 @@
+import argparse
+import time
+import numpy as np
+from ann_index import IVFIndex, default_list_count
+from descriptor_index import DescriptorIndex, DESCRIPTOR_SIZE
+
+# Recall and latency of the IVF index against exact search, for both nearest and farthest matches.
+# Usage: python bench_ann.py --count 200000 --nprobe 1 4 8 16 32
+#        python bench_ann.py --database ../database0
+
+
+def synthetic_descriptors(count, seed):
+    # Face descriptors form loose clusters, one per kind of face, rather than a uniform cloud
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 0.1, size=(max(1, count // 100), DESCRIPTOR_SIZE))
+    vectors = centers[rng.integers(len(centers), size=count)] + rng.normal(0, 0.05, size=(count, DESCRIPTOR_SIZE))
+    return vectors.astype(np.float32)
+
+
+def exact_search(matrix, norms, query, k, farthest):
+    scores = norms - 2.0 * (matrix @ query)
+    if farthest:
+        scores = -scores
+    top = np.argpartition(scores, k - 1)[:k]
+    return top[np.argsort(scores[top])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the IVF index against exact descriptor search')
+    parser.add_argument('--count', type=int, default=100000, help='Synthetic descriptors to index')
+    parser.add_argument('--database', help='Index a real database folder instead of synthetic descriptors')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--k', type=int, default=63, help='Matches per side, num_vids plus the re-rank margin')
+    parser.add_argument('--lists', type=int, default=None)
+    parser.add_argument('--nprobe', type=int, nargs='+', default=[1, 4, 8, 16, 32, 64, 128])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.database:
+        index = DescriptorIndex(args.database)
+        index.load()
+        matrix = index.matrix
+    else:
+        matrix = synthetic_descriptors(args.count, args.seed)
+    if len(matrix) <= args.k:
+        print(f"Need more than {args.k} descriptors, got {len(matrix)}")
+        return
+    norms = np.einsum('ij,ij->i', matrix, matrix)
+
+    # Queries are perturbed database rows, like a returning visitor photographed again
+    rng = np.random.default_rng(args.seed + 1)
+    queries = matrix[rng.integers(len(matrix), size=args.queries)] + rng.normal(0, 0.03, size=(args.queries, DESCRIPTOR_SIZE)).astype(np.float32)
+
+    start = time.perf_counter()
+    ann = IVFIndex.train(matrix, n_lists=args.lists)
+    print(f"{len(matrix)} descriptors, {args.lists or default_list_count(len(matrix))} lists, "
+          f"trained in {time.perf_counter() - start:.2f} s")
+
+    exact = {}
+    for farthest in (False, True):
+        start = time.perf_counter()
+        exact[farthest] = [exact_search(matrix, norms, q, args.k, farthest) for q in queries]
+        exact_ms = (time.perf_counter() - start) / args.queries * 1000
+        print(f"exact {'farthest' if farthest else 'nearest'}: {exact_ms:.2f} ms/query")
+
+    print(f"{'nprobe':>6} {'near recall':>11} {'near ms':>8} {'far recall':>10} {'far ms':>7}")
+    for nprobe in args.nprobe:
+        row = []
+        for farthest in (False, True):
+            start = time.perf_counter()
+            results = [ann.search(q, args.k, nprobe, farthest)[0] for q in queries]
+            elapsed_ms = (time.perf_counter() - start) / args.queries * 1000
+            recall = np.mean([len(np.intersect1d(found, truth)) / args.k for found, truth in zip(results, exact[farthest])])
+            row += [recall, elapsed_ms]
+        print(f"{nprobe:>6} {row[0]:11.3f} {row[1]:8.2f} {row[2]:10.3f} {row[3]:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,21 @@
+import asyncio
+import threading
+import numpy as np
+from mock_backend import MockBackend, PROFILES
+from descriptor_store import DATABASE_DIR
+
+# Shared by the load generator, the headless runner and the session trace replay
+
+
+def percentile_ms(values, q, empty=float('nan')):
+    return float(np.percentile(values, q)) * 1000 if values else empty
+
+
+def start_mock_backend(url, profile, base_dir=DATABASE_DIR, seed=0, workers=1):
+    # Serves the mock on url's port from a daemon thread, returns once it accepts connections
+    backend = MockBackend(base_dir, seed=seed, workers=workers, **PROFILES[profile])
+    ready = threading.Event()
+    port = int(url.rsplit(':', 1)[1])
+    threading.Thread(target=lambda: asyncio.run(backend.serve(port=port, ready=ready)), name='mock-backend', daemon=True).start()
+    ready.wait()
+    return backend
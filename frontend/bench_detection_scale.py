@@ -0,0 +1,75 @@
+import argparse
+import time
+import cv2
+import numpy as np
+from mediapipe_face_detection import MediaPipeFaceDetection
+
+# Per-frame detection cost at each detection width, on frames from a camera, a video or one image.
+# Usage: python bench_detection_scale.py --source 0 --frames 200
+#        python bench_detection_scale.py --source visitor.mp4 --widths 0 1280 640 320
+
+DEFAULT_WIDTHS = [0, 1280, 960, 640, 480, 320]  # 0 = full resolution
+
+
+def read_frames(source, count):
+    image = cv2.imread(source) if not source.isdigit() else None
+    if image is not None:
+        return [image] * count
+
+    cap = cv2.VideoCapture(int(source) if source.isdigit() else source)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def bench(detector, frames, width):
+    # Warm up so model initialisation is not counted
+    for frame in frames[:5]:
+        detector.run_detection(frame, width)
+
+    timings = []
+    found = 0
+    for frame in frames:
+        start = time.perf_counter()
+        results = detector.run_detection(frame, width)
+        timings.append(time.perf_counter() - start)
+        if results.detections:
+            found += 1
+    timings = np.array(timings) * 1000
+    return timings, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark face detection cost per detection width')
+    parser.add_argument('--source', default='0', help='Camera index, video file or image file')
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--widths', type=int, nargs='+', default=DEFAULT_WIDTHS)
+    parser.add_argument('--process', action='store_true', help='Run detection in the worker process')
+    args = parser.parse_args()
+
+    frames = read_frames(args.source, args.frames)
+    if not frames:
+        print(f"No frames could be read from {args.source}")
+        return
+    h, w = frames[0].shape[:2]
+    print(f"{len(frames)} frames at {w}x{h}")
+
+    detector = MediaPipeFaceDetection(use_process=args.process)
+    try:
+        print(f"{'width':>6} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'faces':>6}")
+        for width in args.widths:
+            timings, found = bench(detector, frames, width)
+            label = 'full' if not width or width >= w else str(width)
+            print(f"{label:>6} {timings.mean():8.2f} {np.percentile(timings, 50):8.2f} "
+                  f"{np.percentile(timings, 95):8.2f} {found:>6}")
+    finally:
+        detector.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+import os
+import time
+import argparse
+import cv2
+import numpy as np
+from backend_communicator import send_snapshot_to_server
+from descriptor_index import DescriptorIndex
+from descriptor_store import DATABASE_DIR, read_descriptor_folder, list_folders
+from embedder import create_embedder, fuse_descriptors, spritesheet_tiles
+import config
+
+# Match stability with and without multi-frame fusion. The spritesheet tiles of a database folder
+# stand in for the frames of one visitor: each trial matches K random tiles, and the overlap
+# (Jaccard) of the result sets of consecutive trials shows how much one odd frame moves the grid.
+# Usage: python bench_fusion.py --frames 1 3 5                 (backend /get-matches-batch)
+#        python bench_fusion.py --model models/face_recognition_sface_2021dec.onnx
+
+
+def folder_of(path):
+    # .../<folder>/spritesheet/<file>
+    return os.path.basename(os.path.dirname(os.path.dirname(path)))
+
+
+def jaccard(a, b):
+    return len(a & b) / len(a | b) if a | b else 1.0
+
+
+def server_matcher(num_vids):
+    # The request new_faces makes: one crop alone goes to /get-matches, several to /get-matches-batch
+    config.num_vids = num_vids
+    def match(tiles):
+        most_similar, least_similar, success, _ = send_snapshot_to_server(tiles[0], crops=tiles if len(tiles) > 1 else ())
+        return (most_similar, least_similar) if success else None
+    return match
+
+
+def local_matcher(index, num_vids):
+    def match(tiles):
+        descriptor = fuse_descriptors([d for d in (index.embedder.embed(tile) for tile in tiles) if d is not None])
+        return None if descriptor is None else index.search(descriptor, num_vids)
+    return match
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure match stability of single-frame and fused multi-frame matching')
+    parser.add_argument('--base', default=DATABASE_DIR, help='Database folder')
+    parser.add_argument('--model', help='Match in-process with this ONNX model instead of on the backend')
+    parser.add_argument('--frames', type=int, nargs='+', default=[1, 3, 5], help='Frames fused per match')
+    parser.add_argument('--folders', type=int, default=30, help='Database folders used as visitors')
+    parser.add_argument('--trials', type=int, default=5, help='Matches per visitor and frame count')
+    parser.add_argument('--num-vids', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    index = DescriptorIndex(args.base)
+    if args.model:
+        embedder = create_embedder(args.model)
+        if embedder is None:
+            print(f"Could not load {args.model}, see app.log")
+            return
+        index.set_embedder(embedder)
+        if not index.load():
+            return
+        match = local_matcher(index, args.num_vids)
+    else:
+        match = server_matcher(args.num_vids)
+
+    rng = np.random.default_rng(args.seed)
+    names = list_folders(args.base)
+    visitors = []
+    for name in rng.permutation(names):
+        loaded = read_descriptor_folder(args.base, name)
+        if loaded is None:
+            continue
+        entry = index.entries_for(name, loaded[1])[0]
+        image = cv2.imread(entry['path'])
+        tiles = spritesheet_tiles(image, entry['numImages'] or 0, max_tiles=0) if image is not None else []
+        if len(tiles) >= max(args.frames):
+            visitors.append((name, tiles))
+        if len(visitors) >= args.folders:
+            break
+    print(f"{len(visitors)} visitors, {args.trials} trials each, top {args.num_vids} per side")
+
+    print(f"{'frames':>6} {'most overlap':>12} {'least overlap':>13} {'failed':>6} {'ms/match':>8}")
+    for frames in args.frames:
+        most_overlaps, least_overlaps, failed, elapsed, matches = [], [], 0, 0.0, 0
+        for name, tiles in visitors:
+            previous = None
+            for _ in range(args.trials):
+                chosen = [tiles[i] for i in rng.choice(len(tiles), frames, replace=False)]
+                start = time.perf_counter()
+                result = match(chosen)
+                elapsed += time.perf_counter() - start
+                matches += 1
+                if result is None:
+                    failed += 1
+                    continue
+                # The visitor's own folder is left out, it is the top match either way
+                most = {folder_of(e['path']) for e in result[0]} - {name}
+                least = {folder_of(e['path']) for e in result[1]} - {name}
+                if previous is not None:
+                    most_overlaps.append(jaccard(most, previous[0]))
+                    least_overlaps.append(jaccard(least, previous[1]))
+                previous = most, least
+        most_mean = np.mean(most_overlaps) if most_overlaps else float('nan')
+        least_mean = np.mean(least_overlaps) if least_overlaps else float('nan')
+        print(f"{frames:>6} {most_mean:12.3f} {least_mean:13.3f} {failed:>6} {elapsed / max(matches, 1) * 1000:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -10,3 +10,23 @@ create_sprites = True
 show_fps = False
 auto_update = True
 show_saved_frame = False
+speculative_match = False
+detection_process = False
+detection_width = 640
+detect_every_n = 5
+tracking_min_confidence = 0.6
+idle_after = 30
+idle_check_interval = 0.5
+pose_gating = True
+pose_interval = 0.5
+local_matching = False
+ann_index = False
+ann_nprobe = 8
+ann_far_nprobe = 64
+match_cache = True
+match_cache_ttl = 60
+match_cache_tolerance = 0.3
+embedder = 'http'
+embedder_model = 'models/face_recognition_sface_2021dec.onnx'
+match_frames = 3
+trace_path = ''
@@ -0,0 +1,175 @@
+import os
+import re
+import json
+import time
+import shutil
+import argparse
+from datetime import datetime
+import cv2
+import numpy as np
+from descriptor_index import DescriptorIndex
+from descriptor_store import DATABASE_DIR, write_atomic
+from embedder import spritesheet_tiles
+
+# Finds identity folders that hold the same visitor, captured again after a periodic reset or a
+# short face loss, and keeps one folder per visitor. Prints a dry-run report unless --apply is given,
+# which moves the duplicates out of the database and records them in aliases.json.
+# Usage: python dedup_database.py                       (report only)
+#        python dedup_database.py --apply
+#        python dedup_database.py --full --threshold 0.35
+
+ALIASES_FILE = 'aliases.json'
+DEFAULT_THRESHOLD = 0.4  # Well under face-api's usual 0.6 same-person distance
+DEFAULT_MAX_GAP = 900  # Seconds between captures, lookalikes from different days are never merged
+PAIR_BATCH = 1024  # Query rows per distance block
+QUALITY_TILES = 8
+
+
+def capture_time(folder):
+    # X#YYYY-MM-DD-HH-MM-SS-mmm as named by createSpritesheet.js
+    match = re.match(r'X#(\d{4})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-(\d{3})$', folder)
+    if not match:
+        return None
+    year, month, day, hour, minute, second, millis = (int(part) for part in match.groups())
+    return datetime(year, month, day, hour, minute, second, millis * 1000).timestamp()
+
+
+class UnionFind:
+    def __init__(self, count):
+        self.parent = list(range(count))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, i, j):
+        root_i, root_j = self.find(i), self.find(j)
+        if root_i != root_j:
+            self.parent[max(root_i, root_j)] = min(root_i, root_j)
+
+
+def load_aliases(base_dir):
+    path = os.path.join(base_dir, ALIASES_FILE)
+    if not os.path.exists(path):
+        return {'aliases': {}, 'checked': []}
+    with open(path) as aliases_file:
+        return json.load(aliases_file)
+
+
+def save_aliases(base_dir, aliases, checked, threshold):
+    # Chains collapse so every alias points at a folder that still exists
+    resolved = {}
+    for alias in aliases:
+        target = aliases[alias]
+        while target in aliases and target != alias:
+            target = aliases[target]
+        resolved[alias] = target
+    data = {'threshold': threshold, 'aliases': resolved, 'checked': sorted(checked)}
+    write_atomic(os.path.join(base_dir, ALIASES_FILE), lambda aliases_file: aliases_file.write(json.dumps(data, indent=2).encode('utf-8')))
+
+
+def close_pairs(matrix, query_rows, threshold):
+    # Every (i, j) with i in query_rows, j != i and distance below threshold, one BLAS block at a time
+    norms = np.einsum('ij,ij->i', matrix, matrix)
+    pairs = []
+    for start in range(0, len(query_rows), PAIR_BATCH):
+        rows = query_rows[start:start + PAIR_BATCH]
+        squared = norms[rows, None] + norms[None, :] - 2.0 * (matrix[rows] @ matrix.T)
+        for i, j in zip(*np.nonzero(squared < threshold ** 2)):
+            if rows[i] != j:
+                pairs.append((int(rows[i]), int(j), float(np.sqrt(max(squared[i, j], 0.0)))))
+    return pairs
+
+
+def folder_quality(entries):
+    # (frames, sharpness): longer clips first, then the sharper spritesheet
+    frames = sum(entry['numImages'] or 0 for entry in entries)
+    sharpness = []
+    for entry in entries:
+        image = cv2.imread(entry['path'])
+        if image is None:
+            continue
+        for tile in spritesheet_tiles(image, entry['numImages'] or 0, QUALITY_TILES):
+            sharpness.append(cv2.Laplacian(cv2.cvtColor(tile, cv2.COLOR_BGR2GRAY), cv2.CV_64F).var())
+    return frames, float(np.mean(sharpness)) if sharpness else 0.0
+
+
+def folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            total += os.path.getsize(os.path.join(root, file_name))
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Report and merge identity folders of the same visitor')
+    parser.add_argument('--base', default=DATABASE_DIR, help='Database folder')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Descriptor distance below which folders are the same visitor')
+    parser.add_argument('--max-gap', type=float, default=DEFAULT_MAX_GAP, help='Seconds between captures that may still be merged, 0 for any')
+    parser.add_argument('--full', action='store_true', help='Compare every folder, not only those added since the last run')
+    parser.add_argument('--apply', action='store_true', help='Move the duplicates out of the database')
+    parser.add_argument('--trash', help='Where duplicates are moved, defaults to <base>_trash')
+    args = parser.parse_args()
+
+    start_time = time.time()
+    index = DescriptorIndex(args.base)
+    if not index.load():
+        return
+    folders, matrix = index.folders, index.matrix
+    state = load_aliases(args.base)
+    checked = set() if args.full else set(state['checked'])
+    query_rows = np.array([row for row, folder in enumerate(folders) if folder not in checked], dtype=np.int64)
+    print(f"{len(folders)} folders, comparing {len(query_rows)} {'(full pass)' if args.full else 'new'} against all")
+
+    times = [capture_time(folder) for folder in folders]
+    union_find = UnionFind(len(folders))
+    for i, j, _ in close_pairs(matrix, query_rows, args.threshold):
+        if args.max_gap and (times[i] is None or times[j] is None or abs(times[i] - times[j]) > args.max_gap):
+            continue
+        union_find.union(i, j)
+
+    clusters = {}
+    for row in range(len(folders)):
+        clusters.setdefault(union_find.find(row), []).append(row)
+    clusters = [rows for rows in clusters.values() if len(rows) > 1]
+
+    removed, reclaimed = [], 0
+    for rows in sorted(clusters, key=len, reverse=True):
+        quality = {row: folder_quality(index.entries[row]) for row in rows}
+        keep = max(rows, key=lambda row: quality[row])
+        print(f"\nkeep {folders[keep]}  frames={quality[keep][0]} sharpness={quality[keep][1]:.0f}")
+        for row in rows:
+            if row == keep:
+                continue
+            distance = np.sqrt(np.sum((matrix[row].astype(np.float64) - matrix[keep]) ** 2))
+            size = folder_size(os.path.join(args.base, folders[row]))
+            print(f"  drop {folders[row]}  frames={quality[row][0]} sharpness={quality[row][1]:.0f} "
+                  f"distance={distance:.3f} size={size / 1024:.0f} KB")
+            removed.append((folders[row], folders[keep]))
+            reclaimed += size
+
+    print(f"\n{len(clusters)} visitors with duplicates, {len(removed)} of {len(folders)} folders "
+          f"({len(removed) / max(len(folders), 1):.1%}) would be removed, {reclaimed / 1024 ** 2:.1f} MB, "
+          f"in {time.time() - start_time:.1f} s")
+    if not args.apply:
+        print("Dry run, nothing changed. Run again with --apply to move the duplicates out.")
+        return
+
+    trash = args.trash or f"{os.path.normpath(args.base)}_trash"
+    os.makedirs(trash, exist_ok=True)
+    aliases = dict(state['aliases'])
+    for folder, kept in removed:
+        shutil.move(os.path.join(args.base, folder), os.path.join(trash, folder))
+        aliases[folder] = kept
+    gone = {folder for folder, _ in removed}
+    save_aliases(args.base, aliases, (checked | set(folders)) - gone, args.threshold)
+    # Compacts the descriptor store down to the folders that are left
+    DescriptorIndex(args.base).load()
+    print(f"Moved {len(removed)} folders to {trash}, aliases in {os.path.join(args.base, ALIASES_FILE)}")
+
+
+if __name__ == '__main__':
+    main()
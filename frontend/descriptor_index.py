@@ -0,0 +1,261 @@
+import os
+import re
+import time
+import threading
+import numpy as np
+from logger_setup import logger
+from ann_index import IVFIndex
+from descriptor_store import DescriptorStore, DATABASE_DIR, DESCRIPTOR_SIZE, FACEAPI_SPACE, read_descriptor_folder, list_folders
+from embedder import embed_folder, EMBED_TILES
+import config
+
+CANDIDATE_MARGIN = 16  # Extra folders re-ranked exactly so float32 rounding cannot change who makes the cut
+ANN_FILE = 'ann_index.npz'  # Saved approximate index, kept next to the identity folders
+ANN_MIN_FOLDERS = 20000  # Below this a full scan is about as fast as probing lists
+
+
+def parse_num_images(file_name):
+    # Same as parseInt(file.split('.')[0], 10) in faceMatching.js
+    match = re.match(r'\s*([+-]?\d+)', file_name.split('.')[0])
+    return int(match.group(1)) if match else None
+
+
+def ann_path(base_dir, space=FACEAPI_SPACE):
+    # Centroids are trained on one space's descriptors, every space gets its own file
+    return os.path.join(base_dir, ANN_FILE if space == FACEAPI_SPACE else f"ann_index-{space}.npz")
+
+
+def exact_distances(rows, descriptor):
+    # Squared and summed left to right like euclideanDistance in faceMatching.js (V8's Math.pow(x, 2)
+    # is x * x), in float64 on the stored float32 descriptors
+    squared = (rows.astype(np.float64) - descriptor) ** 2
+    total = np.zeros(len(rows))
+    for column in squared.T:
+        total += column
+    return np.sqrt(total)
+
+
+class DescriptorIndex:
+    # Every database folder's descriptor in one float32 matrix, with the spritesheet entries of each
+    # folder alongside. Answers the same nearest/farthest lists as findSimilarImages with one
+    # matrix-vector product and argpartition, then re-ranks the few candidates in float64.
+    def __init__(self, base_dir=DATABASE_DIR):
+        self.base_dir = base_dir
+        self.store = DescriptorStore(base_dir)
+        self.lock = threading.Lock()
+        self.loading = None
+        self.ann = None  # Optional IVFIndex over the same rows, see config.ann_index
+        self.embedder = None  # Local embedder whose space the rows are in, None for the face-api descriptors
+        self.set_rows([], np.zeros((0, DESCRIPTOR_SIZE), dtype=np.float32), [])
+
+    @property
+    def ready(self):
+        return len(self.folders) > 0
+
+    @property
+    def space(self):
+        return self.store.space
+
+    def set_embedder(self, embedder):
+        # Called before loading, the rows then come from this embedder's store instead of descriptor.json
+        self.embedder = embedder
+        self.store = DescriptorStore(self.base_dir, embedder.space)
+        self.set_rows([], np.zeros((0, DESCRIPTOR_SIZE), dtype=np.float32), [])
+
+    def read_folder(self, folder, max_tiles=EMBED_TILES):
+        # (descriptor, files) in this index's space, None when the folder cannot be matched
+        loaded = read_descriptor_folder(self.base_dir, folder)
+        if loaded is None or self.embedder is None:
+            return loaded
+        descriptor = embed_folder(self.embedder, self.entries_for(folder, loaded[1]), max_tiles)
+        return None if descriptor is None else (descriptor, loaded[1])
+
+    def entries_for(self, folder, files):
+        return [{'path': os.path.join(self.base_dir, folder, 'spritesheet', file_name),
+                 'numImages': parse_num_images(file_name)} for file_name in files]
+
+    def set_rows(self, folders, matrix, files):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        entries = [self.entries_for(folder, folder_files) for folder, folder_files in zip(folders, files)]
+        with self.lock:
+            self.folders = list(folders)
+            self.folder_rows = {folder: row for row, folder in enumerate(self.folders)}
+            self.entries = entries  # per folder, list of {'path', 'numImages'}
+            self.matrix = matrix
+            self.norms = np.einsum('ij,ij->i', matrix, matrix)
+            self.ann = None
+
+    def add_folder(self, folder):
+        # A newly captured visitor, appended to the store and the index without reloading either
+        if folder in self.folder_rows:
+            return False
+        loaded = self.read_folder(folder)
+        if loaded is None:
+            return False
+        descriptor, files = loaded
+        row_vector = np.asarray(descriptor, dtype=np.float32).reshape(1, DESCRIPTOR_SIZE)
+        try:
+            self.store.append([folder], row_vector, [files])
+        except OSError as e:
+            logger.error(f"Could not append {folder} to the descriptor store: {e}")
+        with self.lock:
+            row = len(self.folders)
+            self.folders.append(folder)
+            self.folder_rows[folder] = row
+            self.entries.append(self.entries_for(folder, files))
+            self.matrix = np.vstack([self.matrix, row_vector])
+            self.norms = np.concatenate([self.norms, np.einsum('ij,ij->i', row_vector, row_vector)])
+            if self.ann is not None:
+                self.ann.add(row_vector, [row])
+        logger.info(f"Descriptor index: added {folder}, {row + 1} folders")
+        return True
+
+    def load_store(self):
+        matrix = None
+        if self.store.exists():
+            try:
+                matrix = self.store.load()
+            except (OSError, ValueError, KeyError) as e:
+                logger.error(f"Descriptor store unreadable, importing again: {e}")
+        if matrix is None and self.space != FACEAPI_SPACE:
+            # Embedding the whole database takes far too long for startup, reembed_database.py does it once
+            logger.error(f"No {self.space} descriptors in {self.base_dir}, run reembed_database.py with that model first")
+            return None
+        if matrix is None:
+            matrix = self.store.import_folders()
+        return matrix
+
+    def load(self):
+        start_time = time.time()
+        try:
+            names = list_folders(self.base_dir)
+            matrix = self.load_store()
+        except OSError as e:
+            logger.error(f"Could not load descriptors from {self.base_dir}: {e}")
+            return False
+        if matrix is None:
+            return False
+        folders, files = self.store.folders, self.store.files
+
+        # Folders removed from disk since the store was written are compacted away
+        on_disk = set(names)
+        keep = [row for row, folder in enumerate(folders) if folder in on_disk]
+        if len(keep) < len(folders):
+            folders, files, matrix = [folders[row] for row in keep], [files[row] for row in keep], matrix[keep]
+            self.store.rewrite(folders, matrix, files)
+
+        # Folders captured while the frontend was not running are read the old way (or embedded) once
+        known = set(folders)
+        new_folders, new_descriptors, new_files = [], [], []
+        for name in names:
+            if name not in known:
+                loaded = self.read_folder(name)
+                if loaded is not None:
+                    new_folders.append(name)
+                    new_descriptors.append(loaded[0])
+                    new_files.append(loaded[1])
+        if new_folders:
+            new_matrix = np.asarray(new_descriptors, dtype=np.float32)
+            self.store.append(new_folders, new_matrix, new_files)
+            folders, files, matrix = folders + new_folders, files + new_files, np.vstack([matrix, new_matrix])
+
+        self.set_rows(folders, matrix, files)
+        print(f"Descriptor index: {len(folders)} folders loaded in {time.time() - start_time:.2f} seconds")
+        logger.info(f"Descriptor index: {len(folders)} {self.space} folders loaded from {self.base_dir} in {time.time() - start_time:.2f} seconds "
+                    f"({len(new_folders)} new, {len(on_disk) - len(keep) - len(new_folders)} without descriptor)")
+        return True
+
+    def start_loading(self):
+        # The first run imports every descriptor.json, matching stays on the server until this is done
+        if self.loading is not None and self.loading.is_alive():
+            return
+        self.loading = threading.Thread(target=self.build, name='descriptor-index-load', daemon=True)
+        self.loading.start()
+
+    def build(self):
+        if self.load() and config.ann_index:
+            self.build_ann()
+
+    def build_ann(self):
+        with self.lock:
+            folders, matrix = list(self.folders), self.matrix
+        if len(folders) < ANN_MIN_FOLDERS:
+            logger.info(f"Descriptor index: {len(folders)} folders, exact search is fast enough without the ANN index")
+            return
+
+        start_time = time.time()
+        path = ann_path(self.base_dir, self.space)
+        ann, labels = IVFIndex.load(path) if os.path.exists(path) else (None, None)
+        if ann is not None and labels is not None and ann.dim == DESCRIPTOR_SIZE:
+            # Saved ids point into the saved folder list, map them onto this run's rows and
+            # insert whatever was captured since the index was written
+            rows = np.array([self.folder_rows.get(str(label), -1) for label in labels] + [-1], dtype=np.int64)
+            ann.list_ids = [rows[ids] for ids in ann.list_ids]
+            ann.remove(lambda ids: ids >= 0)
+            present = np.zeros(len(folders), dtype=bool)
+            present[np.concatenate(ann.list_ids)] = True
+            missing = np.flatnonzero(~present)
+            if len(missing):
+                ann.add(matrix[missing], missing)
+            source = f"loaded from {path}, {len(missing)} folders added"
+        else:
+            ann = IVFIndex.train(matrix)
+            source = f"trained with {len(ann.centroids)} lists"
+
+        with self.lock:
+            # Folders that arrived while this was running
+            if len(self.folders) > len(folders):
+                ann.add(self.matrix[len(folders):], np.arange(len(folders), len(self.folders)))
+            self.ann = ann
+            labels = list(self.folders)
+        ann.save(path, labels=labels)
+        logger.info(f"ANN index {source} in {time.time() - start_time:.2f} seconds")
+
+    def candidates(self, scores, count):
+        # Rows with the lowest scores, unordered
+        if count >= len(scores):
+            return np.arange(len(scores))
+        return np.argpartition(scores, count - 1)[:count]
+
+    def ranked_entries(self, rows, matrix, entries, descriptor):
+        distances = exact_distances(matrix[rows], descriptor)
+        # Ties keep folder order, like the stable sort in findSimilarImages
+        order = np.lexsort((rows, distances))
+        ranked = []
+        for i in order:
+            distance = float(distances[i])
+            for entry in entries[rows[i]]:
+                ranked.append({'path': entry['path'], 'numImages': entry['numImages'], 'distance': distance})
+        return ranked
+
+    def search(self, descriptor, num_vids):
+        descriptor = np.asarray(descriptor, dtype=np.float64).reshape(-1)
+        if len(descriptor) != DESCRIPTOR_SIZE:
+            raise ValueError(f"Expected a {DESCRIPTOR_SIZE}-d descriptor, got {len(descriptor)}")
+        with self.lock:
+            matrix, norms, entries, ann = self.matrix, self.norms, self.entries, self.ann
+        if num_vids <= 0 or len(matrix) == 0:
+            return [], []
+        count = num_vids + CANDIDATE_MARGIN
+
+        if ann is not None:
+            # Only the probed lists are scanned, the candidates are then re-ranked like exact ones
+            query = descriptor.astype(np.float32)
+            nearest, _ = ann.search(query, count, config.ann_nprobe)
+            farthest, _ = ann.search(query, count, config.ann_far_nprobe, farthest=True)
+            # Rows added after the snapshot above are not in this matrix yet
+            nearest = nearest[nearest < len(matrix)]
+            farthest = farthest[farthest < len(matrix)]
+        else:
+            # Squared distance up to the constant |q|^2, one BLAS call for the whole database
+            scores = norms - 2.0 * (matrix @ descriptor.astype(np.float32))
+            nearest = self.candidates(scores, count)
+            farthest = self.candidates(-scores, count)
+
+        # Every folder has at least one spritesheet, so num_vids folders always fill num_vids slots
+        most_similar = self.ranked_entries(nearest, matrix, entries, descriptor)[:num_vids]
+        least_similar = self.ranked_entries(farthest, matrix, entries, descriptor)[-num_vids:][::-1]
+        return most_similar, least_similar
+
+
+descriptor_index = DescriptorIndex()
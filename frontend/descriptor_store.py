@@ -0,0 +1,161 @@
+import os
+import json
+import time
+import argparse
+import threading
+import numpy as np
+from logger_setup import logger
+
+DATABASE_DIR = os.path.join('..', 'database0')
+DESCRIPTOR_SIZE = 128
+FACEAPI_SPACE = 'faceapi'  # Descriptors computed by the backend's face-api model, what descriptor.json holds
+
+
+def read_descriptor_folder(base_dir, folder):
+    # (descriptor, spritesheet file names) of one identity folder, None when it has no usable descriptor
+    folder_dir = os.path.join(base_dir, folder)
+    try:
+        with open(os.path.join(folder_dir, 'descriptor.json')) as descriptor_file:
+            descriptor = json.load(descriptor_file).get('descriptor')
+        files = os.listdir(os.path.join(folder_dir, 'spritesheet'))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading descriptor or spritesheets in {folder_dir}: {e}")
+        return None
+
+    # Folders without spritesheets can never show up in a result, they are left out of the store
+    if not isinstance(descriptor, list) or len(descriptor) != DESCRIPTOR_SIZE or not files:
+        return None
+    return descriptor, files
+
+
+def list_folders(base_dir):
+    with os.scandir(base_dir) as scan:
+        return [entry.name for entry in scan if entry.is_dir()]
+
+
+def write_atomic(path, write):
+    # Written next to the target, synced and moved into place, readers never see half a file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as tmp_file:
+        write(tmp_file)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+
+class DescriptorStore:
+    # Every descriptor in one append-only float32 file, row i belonging to manifest folder i, so the
+    # whole database loads with one np.fromfile instead of a descriptor.json parse per folder.
+    # The manifest is replaced atomically once the rows it lists are on disk: a crash mid-append
+    # leaves at most some unlisted rows at the end, which the next append overwrites.
+    # Descriptors of a local embedding model are kept apart in a store of their own space.
+    def __init__(self, base_dir=DATABASE_DIR, space=FACEAPI_SPACE):
+        self.base_dir = base_dir
+        self.space = space
+        self.prefix = 'descriptors' if space == FACEAPI_SPACE else f"descriptors-{space}"
+        self.manifest_path = os.path.join(base_dir, f"{self.prefix}.json")
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.folders = []
+        self.files = []  # Spritesheet file names of each folder
+
+    @property
+    def data_path(self):
+        # A rewrite goes to a new file, the manifest switches over only once it is complete
+        return os.path.join(self.base_dir, f"{self.prefix}.{self.generation}.f32")
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def load(self, mmap=False):
+        with open(self.manifest_path) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['dim'] != DESCRIPTOR_SIZE or len(manifest['folders']) != manifest['count'] \
+                or manifest.get('space', FACEAPI_SPACE) != self.space:
+            raise ValueError(f"Inconsistent descriptor manifest {self.manifest_path}")
+
+        self.generation = manifest['generation']
+        count = manifest['count']
+        if mmap:
+            matrix = np.memmap(self.data_path, dtype=np.float32, mode='r', shape=(count, DESCRIPTOR_SIZE)) if count else \
+                np.zeros((0, DESCRIPTOR_SIZE), dtype=np.float32)
+        else:
+            matrix = np.fromfile(self.data_path, dtype=np.float32, count=count * DESCRIPTOR_SIZE)
+            if matrix.size != count * DESCRIPTOR_SIZE:
+                raise ValueError(f"{self.data_path} holds fewer rows than the manifest lists")
+            matrix = matrix.reshape(count, DESCRIPTOR_SIZE)
+        self.folders = manifest['folders']
+        self.files = manifest['files']
+        return matrix
+
+    def write_manifest(self):
+        manifest = {
+            'dim': DESCRIPTOR_SIZE,
+            'space': self.space,
+            'generation': self.generation,
+            'count': len(self.folders),
+            'folders': self.folders,
+            'files': self.files,
+        }
+        write_atomic(self.manifest_path, lambda manifest_file: manifest_file.write(json.dumps(manifest).encode('utf-8')))
+
+    def append(self, folders, descriptors, files):
+        rows = np.asarray(descriptors, dtype=np.float32).reshape(-1, DESCRIPTOR_SIZE)
+        with self.lock:
+            count = len(self.folders)
+            mode = 'r+b' if os.path.exists(self.data_path) else 'wb'
+            with open(self.data_path, mode) as data_file:
+                data_file.seek(count * DESCRIPTOR_SIZE * 4)
+                data_file.write(rows.tobytes())
+                data_file.truncate()
+                data_file.flush()
+                os.fsync(data_file.fileno())
+            self.folders = self.folders + list(folders)
+            self.files = self.files + list(files)
+            self.write_manifest()
+
+    def rewrite(self, folders, descriptors, files):
+        rows = np.asarray(descriptors, dtype=np.float32).reshape(-1, DESCRIPTOR_SIZE)
+        with self.lock:
+            old_data_path = self.data_path
+            self.generation += 1
+            write_atomic(self.data_path, lambda data_file: data_file.write(rows.tobytes()))
+            self.folders = list(folders)
+            self.files = list(files)
+            self.write_manifest()
+            if os.path.exists(old_data_path) and old_data_path != self.data_path:
+                os.remove(old_data_path)
+
+    def import_folders(self):
+        # One-off conversion of the per-folder descriptor.json files
+        start_time = time.time()
+        folders, descriptors, files = [], [], []
+        for folder in list_folders(self.base_dir):
+            loaded = read_descriptor_folder(self.base_dir, folder)
+            if loaded is not None:
+                folders.append(folder)
+                descriptors.append(loaded[0])
+                files.append(loaded[1])
+        self.rewrite(folders, descriptors, files)
+        logger.info(f"Descriptor store: imported {len(folders)} folders from {self.base_dir} in {time.time() - start_time:.2f} seconds")
+        return np.asarray(descriptors, dtype=np.float32).reshape(-1, DESCRIPTOR_SIZE)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the consolidated descriptor store from the per-folder descriptor.json files')
+    parser.add_argument('--base', default=DATABASE_DIR, help='Database folder')
+    args = parser.parse_args()
+
+    store = DescriptorStore(args.base)
+    matrix = store.import_folders()
+    print(f"Imported {len(matrix)} descriptors into {store.data_path}")
+
+    start_time = time.time()
+    DescriptorStore(args.base).load()
+    print(f"Store loads in {(time.time() - start_time) * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
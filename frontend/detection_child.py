@@ -0,0 +1,37 @@
+import sys
+from multiprocessing import shared_memory
+import cv2
+import mediapipe
+import numpy as np
+
+# Entry point of the detection worker process. Spawn imports this module in the child, so it
+# imports nothing from the app: no Qt, no new_faces, no backend threads.
+
+
+def worker_main(shm_name, requests, results, model_selection, min_detection_confidence):
+    # Only bboxes and scores travel back to the UI process, as detection_result tuples
+    shm = shared_memory.SharedMemory(name=shm_name)
+    face_detection = mediapipe.solutions.face_detection.FaceDetection(
+        model_selection=model_selection, min_detection_confidence=min_detection_confidence)
+    results.put((0, None))  # Ready
+    try:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            seq, shape = request
+            frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf)
+            detections = []
+            try:
+                found = face_detection.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                for detection in found.detections or []:
+                    bboxC = detection.location_data.relative_bounding_box
+                    score = detection.score[0] if detection.score else 1.0
+                    detections.append((bboxC.xmin, bboxC.ymin, bboxC.width, bboxC.height, score))
+            except Exception as e:
+                print(f"Detection worker failed on frame {seq}: {e}", file=sys.stderr)
+            del frame
+            results.put((seq, detections))
+    finally:
+        face_detection.close()
+        shm.close()
@@ -0,0 +1,15 @@
+from types import SimpleNamespace
+
+# Lightweight stand-ins shaped like MediaPipe's FaceDetection results, so detections that did not
+# come straight from an in-process FaceDetection.process call can go through set_curr_face unchanged
+
+def make_detection(xmin, ymin, width, height, score=1.0):
+    bbox = SimpleNamespace(xmin=xmin, ymin=ymin, width=width, height=height)
+    return SimpleNamespace(score=[score], location_data=SimpleNamespace(relative_bounding_box=bbox))
+
+def make_result(detections):
+    # MediaPipe leaves detections as None rather than an empty list when nothing was found
+    return SimpleNamespace(detections=list(detections) or None)
+
+def tuples_to_result(tuples):
+    return make_result(make_detection(*t) for t in tuples)
@@ -0,0 +1,80 @@
+import multiprocessing as mp
+import queue
+import numpy as np
+from multiprocessing import shared_memory
+from logger_setup import logger
+from detection_result import tuples_to_result
+from detection_child import worker_main
+
+RESULT_TIMEOUT = 1.0  # Seconds to wait for the worker before treating the frame as "no face"
+STARTUP_TIMEOUT = 30.0  # Model loading in the child can take a while on a cold start
+
+
+class DetectionWorkerClient:
+    # One frame in flight: process_frame writes it to shared memory and waits for its detections
+    def __init__(self, model_selection=1, min_detection_confidence=0.5):
+        self.model_selection = model_selection
+        self.min_detection_confidence = min_detection_confidence
+        self.frame_bytes = 0
+        self.shm = None
+        self.process = None
+        self.requests = None
+        self.results = None
+        self.seq = 0
+
+    def start(self, frame_bytes):
+        self.close()
+        # Spawn rather than fork, the parent has Qt and camera threads running
+        ctx = mp.get_context('spawn')
+        self.frame_bytes = frame_bytes
+        self.shm = shared_memory.SharedMemory(create=True, size=frame_bytes)
+        self.requests = ctx.Queue()
+        self.results = ctx.Queue()
+        self.process = ctx.Process(
+            target=worker_main,
+            args=(self.shm.name, self.requests, self.results, self.model_selection, self.min_detection_confidence),
+            name='face-detection-worker', daemon=True)
+        self.process.start()
+        try:
+            self.results.get(timeout=STARTUP_TIMEOUT)
+        except queue.Empty:
+            logger.error("Detection worker did not start in time.")
+        logger.info(f"Started detection worker process {self.process.pid} with a {frame_bytes} byte frame buffer")
+
+    def process_frame(self, frame):
+        if self.process is None or not self.process.is_alive() or frame.nbytes > self.frame_bytes:
+            self.start(max(frame.nbytes, self.frame_bytes))
+
+        self.seq += 1
+        frame = np.ascontiguousarray(frame)
+        target = np.ndarray(frame.shape, dtype=np.uint8, buffer=self.shm.buf)
+        target[...] = frame
+        del target
+        self.requests.put((self.seq, frame.shape))
+
+        while True:
+            try:
+                seq, detections = self.results.get(timeout=RESULT_TIMEOUT)
+            except queue.Empty:
+                # One slow inference, treated as no face. Restarting here would stall the video thread
+                # for the model load, process_frame respawns the worker once it has actually died.
+                logger.warning(f"Detection worker did not answer frame {self.seq} in time.")
+                return tuples_to_result([])
+            # Answers for frames that timed out earlier are skipped
+            if seq == self.seq:
+                return tuples_to_result(detections)
+
+    def close(self):
+        if self.process is not None:
+            try:
+                self.requests.put(None)
+                self.process.join(timeout=1.0)
+            except (OSError, ValueError):
+                pass
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
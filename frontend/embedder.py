@@ -0,0 +1,111 @@
+import os
+import threading
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+from logger_setup import logger
+from descriptor_store import DESCRIPTOR_SIZE, FACEAPI_SPACE
+import config
+
+ONNX_INPUT_SIZE = 112  # SFace and most ArcFace-style models take 112x112 crops
+TILE_SIZE = 100  # Spritesheet tiles, same as spriteFR.js
+TILES_PER_ROW = 19
+EMBED_TILES = 32  # Tiles embedded per spritesheet, spread evenly over the clip
+
+
+class Embedder(ABC):
+    # Turns a BGR face crop into a descriptor. Descriptors of different models are not comparable,
+    # each embedder names its space and the database keeps one descriptor store per space.
+    space = None
+
+    @abstractmethod
+    def embed(self, crop):
+        pass
+
+    def close(self):
+        pass
+
+
+class OnnxEmbedder(Embedder):
+    # A face recognition model loaded from a local ONNX file and run through OpenCV DNN on the CPU,
+    # straight on the 100x100 crop new_faces already cuts around the detected face
+    def __init__(self, model_path, input_size=ONNX_INPUT_SIZE):
+        self.net = cv2.dnn.readNetFromONNX(model_path)
+        self.net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+        self.net.setPreferableTarget(cv2.dnn.DNN_TARGET_CPU)
+        self.input_size = input_size
+        self.space = os.path.splitext(os.path.basename(model_path))[0]
+        self.lock = threading.Lock()  # One Net is not safe to run from several threads at once
+
+    def embed(self, crop):
+        blob = cv2.dnn.blobFromImage(crop, 1.0, (self.input_size, self.input_size), (0, 0, 0), swapRB=True, crop=False)
+        with self.lock:
+            self.net.setInput(blob)
+            descriptor = self.net.forward().reshape(-1).astype(np.float32)
+        # Unit length, so Euclidean distance ranks like the cosine similarity these models are trained for
+        norm = np.linalg.norm(descriptor)
+        return descriptor / norm if norm > 0 else None
+
+
+def create_embedder(model_path=None):
+    # None when the model cannot be used, matching then stays on the backend
+    model_path = model_path or config.embedder_model
+    try:
+        embedder = OnnxEmbedder(model_path)
+        probe = embedder.embed(np.full((TILE_SIZE, TILE_SIZE, 3), 128, dtype=np.uint8))
+    except (cv2.error, OSError) as e:
+        logger.error(f"Could not load face embedding model {model_path}, matching on the backend instead: {e}")
+        return None
+    if embedder.space == FACEAPI_SPACE:
+        # Its store would be the backend's descriptor files, reembed_database.py would overwrite them
+        logger.error(f"Face embedding model {model_path} is named like the face-api space, rename the model file")
+        return None
+    size = 0 if probe is None else probe.size
+    if size != DESCRIPTOR_SIZE:
+        logger.error(f"Face embedding model {model_path} gives {size}-d descriptors, the index holds {DESCRIPTOR_SIZE}-d ones")
+        return None
+    logger.info(f"Local face embedder {embedder.space} loaded from {model_path}")
+    return embedder
+
+
+def spritesheet_tiles(image, num_images, max_tiles=EMBED_TILES):
+    indices = range(num_images)
+    if max_tiles and num_images > max_tiles:
+        indices = np.linspace(0, num_images - 1, max_tiles).astype(int)
+    tiles = []
+    for i in indices:
+        x = (i % TILES_PER_ROW) * TILE_SIZE
+        y = (i // TILES_PER_ROW) * TILE_SIZE
+        tile = image[y:y + TILE_SIZE, x:x + TILE_SIZE]
+        if tile.shape[:2] == (TILE_SIZE, TILE_SIZE):
+            tiles.append(tile)
+    return tiles
+
+
+def embed_folder(embedder, entries, max_tiles=EMBED_TILES):
+    # Mean descriptor over the spritesheet tiles, the way spriteFR.js averages face-api descriptors.
+    # entries are {'path', 'numImages'} like DescriptorIndex keeps them.
+    descriptors = []
+    for entry in entries:
+        image = cv2.imread(entry['path'])
+        if image is None or not entry['numImages']:
+            logger.error(f"Could not read spritesheet {entry['path']}")
+            continue
+        for tile in spritesheet_tiles(image, entry['numImages'], max_tiles):
+            descriptor = embedder.embed(tile)
+            if descriptor is not None:
+                descriptors.append(descriptor)
+    return fuse_descriptors(descriptors)
+
+
+def fuse_descriptors(descriptors):
+    # Mean scaled back to the average input length, like fuseDescriptors in server.js. For this
+    # model's unit-length descriptors that is simply the normalized mean.
+    if not descriptors:
+        return None
+    descriptors = np.asarray(descriptors, dtype=np.float32)
+    fused = descriptors.mean(axis=0)
+    norm = np.linalg.norm(fused)
+    if norm == 0:
+        return fused
+    return (fused * (np.linalg.norm(descriptors, axis=1).mean() / norm)).astype(np.float32)
@@ -0,0 +1,136 @@
+import itertools
+import numpy as np
+from collections import Counter
+from logger_setup import logger
+
+IOU_THRESHOLD = 0.3
+MAX_CENTER_DISTANCE = 0.5  # Center distance, in units of the track's size, that still counts as the same face
+MAX_MISSES = 10  # Frames a track survives without a matching detection
+
+
+class Track:
+    def __init__(self, track_id, bbox, score):
+        self.id = track_id
+        self.bbox = bbox  # (x, y, w, h) in full-resolution pixels
+        self.score = score
+        self.hits = 1
+        self.misses = 0
+
+    @property
+    def visible(self):
+        return self.misses == 0
+
+
+def iou_matrix(a, b):
+    # a is (T, 4), b is (N, 4), both x, y, w, h. Returns the (T, N) IoU of every pair.
+    ax1, ay1, ax2, ay2 = a[:, 0], a[:, 1], a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx1, by1, bx2, by2 = b[:, 0], b[:, 1], b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+    iw = np.clip(np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(ax1[:, None], bx1[None, :]), 0, None)
+    ih = np.clip(np.minimum(ay2[:, None], by2[None, :]) - np.maximum(ay1[:, None], by1[None, :]), 0, None)
+    inter = iw * ih
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return inter / np.maximum(union, 1e-9)
+
+
+def center_distance_matrix(a, b):
+    # Distance between centers, normalised by the mean side length of each track in a
+    ac = a[:, :2] + a[:, 2:] / 2
+    bc = b[:, :2] + b[:, 2:] / 2
+    dist = np.linalg.norm(ac[:, None, :] - bc[None, :, :], axis=2)
+    return dist / np.maximum(a[:, 2:].mean(axis=1), 1e-9)[:, None]
+
+
+class MultiFaceTracker:
+    # Gives every face a stable track ID across frames and keeps one of them "locked" as the
+    # visitor being captured and matched, until that face is really gone
+    def __init__(self, iou_threshold=IOU_THRESHOLD, max_center_distance=MAX_CENTER_DISTANCE, max_misses=MAX_MISSES):
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_misses = max_misses
+        self.tracks = []
+        self.ids = itertools.count(1)
+        self.locked_id = None
+        self.stats = Counter()
+
+    def update(self, boxes, scores):
+        boxes = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+        matched_tracks = set()
+        matched_boxes = set()
+
+        if self.tracks and len(boxes):
+            track_boxes = np.array([t.bbox for t in self.tracks], dtype=np.float32)
+            iou = iou_matrix(track_boxes, boxes)
+            dist = center_distance_matrix(track_boxes, boxes)
+            gate = (iou >= self.iou_threshold) | (dist <= self.max_center_distance)
+            affinity = np.where(gate, iou - dist, -np.inf)
+
+            # Greedy assignment, best pairs first
+            for flat in np.argsort(-affinity, axis=None):
+                ti, bi = np.unravel_index(flat, affinity.shape)
+                if not np.isfinite(affinity[ti, bi]):
+                    break
+                if ti in matched_tracks or bi in matched_boxes:
+                    continue
+                track = self.tracks[ti]
+                track.bbox = tuple(int(v) for v in boxes[bi])
+                track.score = scores[bi]
+                track.hits += 1
+                track.misses = 0
+                matched_tracks.add(ti)
+                matched_boxes.add(bi)
+
+        for ti, track in enumerate(self.tracks):
+            if ti not in matched_tracks:
+                track.misses += 1
+
+        lost = [t for t in self.tracks if t.misses > self.max_misses]
+        for track in lost:
+            self.stats['lost'] += 1
+            if track.id == self.locked_id:
+                logger.info(f"Locked face track {track.id} lost.")
+                self.locked_id = None
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for bi in range(len(boxes)):
+            if bi not in matched_boxes:
+                self.tracks.append(Track(next(self.ids), tuple(int(v) for v in boxes[bi]), scores[bi]))
+                self.stats['created'] += 1
+
+        return [t for t in self.tracks if t.visible]
+
+    def update_locked(self, bbox, score):
+        # Between full detections only the locked face is followed, the other tracks are left alone
+        track = self.get(self.locked_id)
+        if track is not None:
+            track.bbox = tuple(int(v) for v in bbox)
+            track.score = score
+            track.misses = 0
+        return track
+
+    def get(self, track_id):
+        for track in self.tracks:
+            if track.id == track_id:
+                return track
+        return None
+
+    def primary(self, frame_shape):
+        # The locked track while it exists, otherwise lock onto the visible face closest to the center
+        track = self.get(self.locked_id)
+        if track is not None:
+            return track if track.visible else None
+
+        visible = [t for t in self.tracks if t.visible]
+        if not visible:
+            return None
+        h, w = frame_shape[:2]
+        centers = np.array([(t.bbox[0] + t.bbox[2] / 2, t.bbox[1] + t.bbox[3] / 2) for t in visible])
+        distances = np.sum((centers - np.array([w / 2, h / 2])) ** 2, axis=1)
+        track = visible[int(np.argmin(distances))]
+        self.locked_id = track.id
+        self.stats['locked'] += 1
+        logger.info(f"Locked onto face track {track.id}.")
+        return track
+
+    def reset(self):
+        self.tracks = []
+        self.locked_id = None
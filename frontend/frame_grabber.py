@@ -0,0 +1,65 @@
+import threading
+import time
+from logger_setup import logger
+
+
+class LatestFrameSlot:
+    # Holds only the newest frame, a frame nobody took before the next one arrived is dropped
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.frame = None
+        self.timestamp = None
+        self.closed = False
+        self.captured = 0
+        self.dropped = 0
+
+    def put(self, frame, timestamp):
+        with self.condition:
+            if self.frame is not None:
+                self.dropped += 1
+            self.frame = frame
+            self.timestamp = timestamp
+            self.captured += 1
+            self.condition.notify()
+
+    def take(self, timeout=None):
+        with self.condition:
+            if self.frame is None and not self.closed:
+                self.condition.wait(timeout)
+            frame, timestamp = self.frame, self.timestamp
+            self.frame = None
+            self.timestamp = None
+            return frame, timestamp
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
+class CaptureThread(threading.Thread):
+    def __init__(self, cap, slot):
+        super().__init__(name='camera-capture', daemon=True)
+        self.cap = cap
+        self.slot = slot
+        self.stopped = threading.Event()
+        self.read_failures = 0
+
+    def run(self):
+        # Reading continuously keeps the camera's own buffer drained, so the newest frame is always fresh
+        while not self.stopped.is_set():
+            ret, frame = self.cap.read()
+            if self.cap.exhausted:
+                # A video file or image folder came to its end, the consumer sees the slot closed
+                self.slot.close()
+                break
+            if not ret or frame is None or frame.size == 0:
+                self.read_failures += 1
+                time.sleep(0.01)
+                continue
+            self.slot.put(frame, time.time())
+        logger.info("Camera capture thread stopped.")
+
+    def stop(self):
+        self.stopped.set()
+        self.slot.close()
@@ -0,0 +1,156 @@
+import os
+import time
+from abc import ABC, abstractmethod
+import cv2
+import numpy as np
+from logger_setup import logger
+
+# Where frames come from. Every source reads like cv2.VideoCapture (read, isOpened, release), so
+# CaptureThread and the headless runner take any of them. Finite sources set exhausted at the end.
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+SYNTHETIC_SIZE = (720, 1280)
+
+
+class Pacer:
+    # Spaces reads 1/fps apart, fps of 0 or None reads as fast as the consumer takes them
+    def __init__(self, fps):
+        self.interval = 1.0 / fps if fps else 0.0
+        self.next_time = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self.next_time is None or now - self.next_time > self.interval:
+            # First frame, or the consumer fell behind: restart the schedule instead of bursting
+            self.next_time = now
+        elif self.next_time > now:
+            time.sleep(self.next_time - now)
+        self.next_time += self.interval
+
+
+class FrameSource(ABC):
+    live = False  # A live source keeps producing whether or not frames are taken
+    exhausted = False
+
+    @abstractmethod
+    def read(self):
+        pass
+
+    def isOpened(self):
+        return True
+
+    def release(self):
+        pass
+
+
+class CameraSource(FrameSource):
+    live = True
+
+    def __init__(self, index=0):
+        self.cap = cv2.VideoCapture(index)
+
+    def read(self):
+        return self.cap.read()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class VideoFileSource(FrameSource):
+    def __init__(self, path, fps=None, loop=False):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        self.loop = loop
+        # None plays at the file's own rate, 0 as fast as frames can be decoded
+        self.pacer = Pacer(self.cap.get(cv2.CAP_PROP_FPS) if fps is None else fps)
+
+    def read(self):
+        self.pacer.wait()
+        ret, frame = self.cap.read()
+        if not ret and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ret, frame = self.cap.read()
+        if not ret:
+            self.exhausted = True
+        return ret, frame
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def release(self):
+        self.cap.release()
+
+
+class ImageDirSource(FrameSource):
+    def __init__(self, path, fps=0, loop=False):
+        self.paths = sorted(os.path.join(path, name) for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        self.loop = loop
+        self.pacer = Pacer(fps)
+        self.position = 0
+        self.cache = {}  # Decoded once, later loops measure the pipeline rather than JPEG decoding
+
+    def read(self):
+        if self.position >= len(self.paths):
+            if not self.loop or not self.paths:
+                self.exhausted = True
+                return False, None
+            self.position = 0
+        self.pacer.wait()
+        path = self.paths[self.position]
+        self.position += 1
+        if path not in self.cache:
+            self.cache[path] = cv2.imread(path)
+        frame = self.cache[path]
+        return frame is not None, frame
+
+    def isOpened(self):
+        return bool(self.paths)
+
+
+class SyntheticSource(FrameSource):
+    # A face image drifting over a noisy background, or only the background without one. Every run
+    # with the same seed produces the same frames.
+    def __init__(self, face_path=None, size=SYNTHETIC_SIZE, fps=0, count=None, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.height, self.width = size
+        self.background = cv2.GaussianBlur(self.rng.integers(40, 200, size=(self.height, self.width, 3), dtype=np.uint8), (31, 31), 0)
+        self.face = cv2.imread(face_path) if face_path else None
+        if face_path and self.face is None:
+            logger.error(f"Synthetic source: could not read face image {face_path}")
+        self.pacer = Pacer(fps)
+        self.count = count
+        self.index = 0
+
+    def read(self):
+        if self.count is not None and self.index >= self.count:
+            self.exhausted = True
+            return False, None
+        self.pacer.wait()
+        frame = self.background.copy()
+        if self.face is not None:
+            # Slow Lissajous drift with a little size change, like a visitor shifting in front of the screen
+            t = self.index / 30.0
+            side = int(min(self.height, self.width) * (0.35 + 0.05 * np.sin(t * 0.7)))
+            x = int((self.width - side) * (0.5 + 0.3 * np.sin(t * 0.5)))
+            y = int((self.height - side) * (0.5 + 0.2 * np.sin(t * 0.8)))
+            frame[y:y + side, x:x + side] = cv2.resize(self.face, (side, side))
+        frame = cv2.add(frame, self.rng.integers(0, 4, size=frame.shape, dtype=np.uint8))  # Sensor noise, no two frames identical
+        self.index += 1
+        return True, frame
+
+
+def create_frame_source(spec=0, fps=None, loop=False, seed=0):
+    # spec: a camera index, a video file, a folder of images, or synthetic[:<face image>]
+    if isinstance(spec, int) or str(spec).isdigit():
+        return CameraSource(int(spec))
+    spec = str(spec)
+    if spec == 'synthetic' or spec.startswith('synthetic:'):
+        face_path = spec.split(':', 1)[1] if ':' in spec else None
+        return SyntheticSource(face_path, fps=fps or 0, seed=seed)
+    if os.path.isdir(spec):
+        return ImageDirSource(spec, fps=fps or 0, loop=loop)
+    return VideoFileSource(spec, fps=fps, loop=loop)
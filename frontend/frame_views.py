@@ -0,0 +1,48 @@
+import cv2
+
+
+class Frame:
+    # One camera frame plus the downscaled and color-converted views the pipeline stages need.
+    # Each view is computed at most once per frame and shared between detection, tracking and
+    # motion checks instead of every stage running its own resize and cvtColor.
+    def __init__(self, bgr, timestamp=None):
+        self.bgr = bgr
+        self.timestamp = timestamp
+        self.height, self.width = bgr.shape[:2]
+        self.views = {}
+
+    @property
+    def shape(self):
+        return self.bgr.shape
+
+    def target_width(self, width):
+        return self.width if not width or width >= self.width else width
+
+    def scale_for(self, width):
+        return self.target_width(width) / self.width
+
+    def resized(self, width=None):
+        width = self.target_width(width)
+        if width == self.width:
+            return self.bgr
+        key = ('bgr', width)
+        if key not in self.views:
+            height = max(1, int(round(self.height * width / self.width)))
+            self.views[key] = cv2.resize(self.bgr, (width, height), interpolation=cv2.INTER_AREA)
+        return self.views[key]
+
+    def rgb(self, width=None):
+        key = ('rgb', self.target_width(width))
+        if key not in self.views:
+            self.views[key] = cv2.cvtColor(self.resized(width), cv2.COLOR_BGR2RGB)
+        return self.views[key]
+
+    def gray(self, width=None):
+        key = ('gray', self.target_width(width))
+        if key not in self.views:
+            self.views[key] = cv2.cvtColor(self.resized(width), cv2.COLOR_BGR2GRAY)
+        return self.views[key]
+
+
+def as_frame(frame):
+    return frame if isinstance(frame, Frame) else Frame(frame)
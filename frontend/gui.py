@@ -309,6 +309,26 @@ class SliderOverlay(QWidget):
             config_file.write(f"show_fps = {config.show_fps}\n")
             config_file.write(f"auto_update = {config.auto_update}\n")
             config_file.write(f"show_saved_frame = {config.show_saved_frame}\n")  # Write the new config value
+            config_file.write(f"speculative_match = {config.speculative_match}\n")
+            config_file.write(f"detection_process = {config.detection_process}\n")
+            config_file.write(f"detection_width = {config.detection_width}\n")
+            config_file.write(f"detect_every_n = {config.detect_every_n}\n")
+            config_file.write(f"tracking_min_confidence = {config.tracking_min_confidence}\n")
+            config_file.write(f"idle_after = {config.idle_after}\n")
+            config_file.write(f"idle_check_interval = {config.idle_check_interval}\n")
+            config_file.write(f"pose_gating = {config.pose_gating}\n")
+            config_file.write(f"pose_interval = {config.pose_interval}\n")
+            config_file.write(f"local_matching = {config.local_matching}\n")
+            config_file.write(f"ann_index = {config.ann_index}\n")
+            config_file.write(f"ann_nprobe = {config.ann_nprobe}\n")
+            config_file.write(f"ann_far_nprobe = {config.ann_far_nprobe}\n")
+            config_file.write(f"match_cache = {config.match_cache}\n")
+            config_file.write(f"match_cache_ttl = {config.match_cache_ttl}\n")
+            config_file.write(f"match_cache_tolerance = {config.match_cache_tolerance}\n")
+            config_file.write(f"embedder = {config.embedder!r}\n")
+            config_file.write(f"embedder_model = {config.embedder_model!r}\n")
+            config_file.write(f"match_frames = {config.match_frames}\n")
+            config_file.write(f"trace_path = {config.trace_path!r}\n")
 
         # Emit signal to update the config
         self.config_changed.emit()
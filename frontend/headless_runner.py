@@ -0,0 +1,151 @@
+import sys
+import time
+import argparse
+import threading
+from logger_setup import logger
+from frame_source import create_frame_source
+from frame_grabber import LatestFrameSlot, CaptureThread
+from frame_views import Frame
+from mediapipe_face_detection import MediaPipeFaceDetection
+from mock_backend import PROFILES
+from bench_common import percentile_ms, start_mock_backend
+from descriptor_store import DATABASE_DIR
+import backend_communicator
+import new_faces
+import config
+
+# Runs detection, tracking, capture and matching without Qt or a display, from any frame source,
+# and reports end-to-end throughput. Finite sources are processed frame by frame so runs repeat;
+# a camera goes through the capture thread and drops frames like the app does.
+# Usage: python headless_runner.py --source synthetic:face.jpg --frames 600 --mock instant
+#        python headless_runner.py --source clip.mp4 --fps 30 --url http://localhost:3000
+
+DRAIN_TIMEOUT = 30.0  # Seconds to wait for matches and uploads still in flight at the end
+
+
+class MatchRecorder:
+    # Stands in for the grid's load_images callback
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.times = []
+        self.sizes = []
+
+    def __call__(self, most_similar, least_similar):
+        with self.lock:
+            self.times.append(time.perf_counter())
+            self.sizes.append((len(most_similar or []), len(least_similar or [])))
+
+
+def drain(scheduler, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        lanes = scheduler.stats().values()
+        if all(lane['queue_depth'] == 0 and lane['running'] == 0 for lane in lanes):
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def frames_from(source, live):
+    # Finite sources are read in the loop's own thread, every frame gets processed
+    if not live:
+        while True:
+            ret, frame = source.read()
+            if source.exhausted:
+                return
+            if ret and frame is not None:
+                yield frame, time.time()
+
+    slot = LatestFrameSlot()
+    capture = CaptureThread(source, slot)
+    capture.start()
+    try:
+        while True:
+            frame, timestamp = slot.take(timeout=0.5)
+            if frame is not None:
+                yield frame, timestamp
+            elif slot.closed:
+                return
+    finally:
+        capture.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the face pipeline without a display and report its throughput')
+    parser.add_argument('--source', default='synthetic', help='Camera index, video file, image folder or synthetic[:<face image>]')
+    parser.add_argument('--fps', type=float, default=0, help='Frames per second to feed, 0 for as fast as possible')
+    parser.add_argument('--loop', action='store_true', help='Start video files and image folders over at the end')
+    parser.add_argument('--frames', type=int, default=0, help='Stop after this many frames, 0 for no limit')
+    parser.add_argument('--duration', type=float, default=0, help='Stop after this many seconds, 0 for no limit')
+    parser.add_argument('--url', default=backend_communicator.BASE_SERVER_URL)
+    parser.add_argument('--mock', choices=sorted(PROFILES), help='Start the mock backend with this profile on --url')
+    parser.add_argument('--base', default=DATABASE_DIR, help='Fixture database for the mock backend')
+    parser.add_argument('--periodic-reset', action='store_true', help='Keep the periodic face reset, off for repeatable runs')
+    parser.add_argument('--num-vids', type=int, default=backend_communicator.GRID_NUM_VIDS, help='Matches requested per side, the grid size')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backend_communicator.BASE_SERVER_URL = args.url
+    config.auto_update = args.periodic_reset
+    config.num_vids = args.num_vids  # Set by ImageApp in the app
+    if args.mock:
+        start_mock_backend(args.url, args.mock, args.base, args.seed)
+
+    source = create_frame_source(args.source, fps=args.fps, loop=args.loop, seed=args.seed)
+    if not source.isOpened():
+        print(f"Could not open frame source {args.source}")
+        return
+    detector = MediaPipeFaceDetection()
+    recorder = MatchRecorder()
+    new_faces.start_periodic_reset()
+
+    frame_times, latencies, faces = [], [], 0
+    first_face = None
+    start_time = time.perf_counter()
+    for frame, timestamp in frames_from(source, source.live):
+        frame_start = time.perf_counter()
+        _, bbox = detector.detect_faces(Frame(frame, timestamp), recorder)
+        frame_end = time.perf_counter()
+        frame_times.append(frame_end - frame_start)
+        latencies.append(time.time() - timestamp)
+        if bbox is not None:
+            faces += 1
+            if first_face is None:
+                first_face = frame_start
+        if args.frames and len(frame_times) >= args.frames:
+            break
+        if args.duration and frame_end - start_time >= args.duration:
+            break
+    elapsed = time.perf_counter() - start_time
+
+    drained = drain(new_faces.scheduler, DRAIN_TIMEOUT)
+    source.release()
+    detector.log_stats()
+    detector.close()
+
+    count = len(frame_times)
+    print(f"\n{count} frames from {args.source} in {elapsed:.1f} s: {count / max(elapsed, 1e-6):.1f} frames/s, "
+          f"face in {faces} ({faces / max(count, 1):.0%})")
+    print(f"  per-frame pipeline ms: p50={percentile_ms(frame_times, 50):.1f} p90={percentile_ms(frame_times, 90):.1f} "
+          f"p99={percentile_ms(frame_times, 99):.1f} max={max(frame_times, default=0) * 1000:.1f}")
+    print(f"  capture-to-processed ms: p50={percentile_ms(latencies, 50):.1f} p99={percentile_ms(latencies, 99):.1f}")
+    with recorder.lock:
+        grids = list(recorder.times)
+    first_grid = f", first {(grids[0] - first_face) * 1000:.0f} ms after the first face" if grids and first_face else ''
+    print(f"  grids delivered: {len(grids)}{first_grid}")
+    with new_faces.session.lock:
+        transitions = ', '.join(f"{name}={n}" for name, n in sorted(new_faces.session.transition_counts.items()))
+    print(f"  face session: {transitions or 'no transitions'}")
+    with backend_communicator.snapshot_stats_lock:
+        outcomes = ', '.join(f"{name}={n}" for name, n in sorted(backend_communicator.snapshot_stats.items()))
+    print(f"  backend: {outcomes or 'no requests'}{'' if drained else ' (requests still in flight at exit)'}")
+    new_faces.stop_all_threads()
+    logger.info("Headless run finished.")
+    if not grids:
+        # A run that never matched measured nothing but detection, say so instead of printing numbers
+        print(f"ERROR: no match succeeded{' although faces were found' if faces else ', no face was found'}, see app.log")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,13 +10,14 @@ import config
 from gui import SliderOverlay
 from text_overlay import add_text_overlay, update_font_size
 from video_processor import VideoProcessor
-from image_loader import ImageLoader
+from image_loader import ImageLoader, warm_sprites
 from backend_communicator import send_snapshot_to_server
 from logger_setup import logger
-from new_faces import stop_all_threads
+from new_faces import stop_all_threads, set_warm_callback
+from session_trace import tracer
 
 class ImageApp(QWidget):
-    def __init__(self, preloaded_images, update_count=config.update_count):
+    def __init__(self, preloaded_images, update_count=config.update_count, frame_source=None):
         super().__init__()
         self.preloaded_images = preloaded_images  # Store preloaded images
         print("Initializing ImageApp.")
@@ -43,7 +44,8 @@ class ImageApp(QWidget):
         self.most_similar = []
         self.least_similar = []
 
-        self.video_processor = VideoProcessor(square_size=int(self.square_size * 3), callback=self.load_images)
+        set_warm_callback(self.warm_images)
+        self.video_processor = VideoProcessor(square_size=int(self.square_size * 3), callback=self.load_images, frame_source=frame_source)
         self.video_processor.frame_ready.connect(self.update_video_label)
         print("Starting VideoProcessor in ImageApp.")
         self.video_processor.start()
@@ -184,7 +186,11 @@ class ImageApp(QWidget):
                 self.least_similar_sprite_index = (self.least_similar_sprite_index + 1) % len(self.sprites[least_similar_index])
 
     def update_video_label(self, q_img):
-        self.video_label.setPixmap(QPixmap.fromImage(q_img))
+        try:
+            self.video_label.setPixmap(QPixmap.fromImage(q_img))
+        finally:
+            # Lets the video thread send the next preview frame
+            self.video_processor.preview.ack()
 
     def cv2_to_qpixmap(self, cv_img, target_width, target_height, add_overlay=False, overlay_text=""):
         if not isinstance(cv_img, np.ndarray):
@@ -201,6 +207,10 @@ class ImageApp(QWidget):
         q_img = QImage(cv_img_rgb.data, width, height, bytes_per_line, QImage.Format_RGB888)
         return QPixmap.fromImage(q_img)
 
+    def warm_images(self, most_similar, least_similar):
+        # Called from a backend worker thread with a speculative match, only touches the sprite cache
+        warm_sprites(most_similar + least_similar, self.preloaded_images)
+
     def load_images(self, most_similar, least_similar):
         if self.image_loader_running:
             print("Image loader is already running. Skipping new load request.")
@@ -225,6 +235,7 @@ class ImageApp(QWidget):
         self.image_loader_thread.start()
 
     def handle_all_sprites_loaded(self, all_sprites, most_similar_indices, least_similar_indices):
+        tracer.grid()
         self.all_sprites = all_sprites
         self.most_similar_indices = most_similar_indices
         self.least_similar_indices = least_similar_indices
@@ -2,7 +2,53 @@ from PyQt5.QtCore import QThread, pyqtSignal
 import config
 from logger_setup import logger
 import time
+import threading
 import concurrent.futures
+from collections import OrderedDict
+
+# Sprite frames cut out of preloaded spritesheets, shared between ImageLoader runs so tiles
+# warmed by a speculative match are ready by the time the grid loads them
+SPRITE_CACHE_SIZE = 2000
+sprite_cache = OrderedDict()
+sprite_cache_lock = threading.Lock()
+
+def get_sprite_frames(image_info, preloaded_images):
+    image_path = image_info['path']
+    key = (image_path, image_info['numImages'])
+    with sprite_cache_lock:
+        if key in sprite_cache:
+            sprite_cache.move_to_end(key)
+            return sprite_cache[key]
+
+    if image_path not in preloaded_images:
+        logger.error(f"Image at path {image_path} is not preloaded")
+        return None
+
+    image = preloaded_images[image_path]
+    if image is None:
+        logger.error(f"Preloaded image at path {image_path} is None")
+        return None
+
+    loaded_images = []
+    for i in range(image_info['numImages']):
+        x = (i % 19) * 100
+        y = (i // 19) * 100
+        cropped_image = image[y:y + 100, x:x + 100]
+        if cropped_image.shape[0] == 100 and cropped_image.shape[1] == 100:
+            loaded_images.append(cropped_image)
+
+    frames = loaded_images + loaded_images[::-1]
+    with sprite_cache_lock:
+        sprite_cache[key] = frames
+        if len(sprite_cache) > SPRITE_CACHE_SIZE:
+            sprite_cache.popitem(last=False)
+    return frames
+
+def warm_sprites(image_infos, preloaded_images):
+    start_time = time.time()
+    for image_info in image_infos:
+        get_sprite_frames(image_info, preloaded_images)
+    logger.info(f"Warmed {len(image_infos)} sprites in {(time.time() - start_time) * 1000:.1f} ms")
 
 class ImageLoader(QThread):
     all_sprites_loaded = pyqtSignal(list, list, list)  # Signal to emit when all images are loaded
@@ -96,29 +142,11 @@ class ImageLoader(QThread):
         logger.info(f"Image loading completed in {duration:.2f} seconds")
 
     def load_and_append_image(self, image_info, grid_index, sprites, indices_list):
-        image_path = image_info['path']
-        if image_path not in self.preloaded_images:
-            logger.error(f"Image at path {image_path} is not preloaded")
+        frames = get_sprite_frames(image_info, self.preloaded_images)
+        if frames is None:
             return False
 
-        image = self.preloaded_images[image_path]
-        if image is None:
-            logger.error(f"Preloaded image at path {image_path} is None")
-            return False
-
-        loaded_images = []
-
-        for i in range(image_info['numImages']):
-            x = (i % 19) * 100
-            y = (i // 19) * 100
-            cropped_image = image[y:y + 100, x:x + 100]
-            if cropped_image.shape[0] == 100 and cropped_image.shape[1] == 100:
-                loaded_images.append(cropped_image)
-
-        for img in loaded_images:
-            sprites[grid_index].append(img)
-        for img in reversed(loaded_images):
-            sprites[grid_index].append(img)
+        sprites[grid_index].extend(frames)
 
         indices_list.append(grid_index)
         return True
@@ -0,0 +1,144 @@
+import os
+import time
+import random
+import asyncio
+import argparse
+import threading
+from collections import Counter
+import cv2
+import numpy as np
+import backend_communicator
+from backend_communicator import send_snapshot_to_server, send_frames_to_backend, snapshot_stats, snapshot_stats_lock
+from mock_backend import PROFILES
+from bench_common import percentile_ms, start_mock_backend
+from descriptor_store import DATABASE_DIR
+import config
+
+# Drives backend_communicator from N simulated kiosks at once and reports latency percentiles and
+# throughput, against the real backend or the mock one started in-process.
+# Usage: python load_generator.py --kiosks 8 --duration 30 --mock typical
+#        python load_generator.py --kiosks 4 --url http://localhost:3000 --images ../captures
+
+SYNTHETIC_FRAMES = 16
+FRAME_SIZE = (480, 640)
+SPRITESHEET_FRAMES = 20
+
+# Exceptions raised by requests, by kind and type
+errors = Counter()
+errors_lock = threading.Lock()
+
+
+def load_frames(image_dir):
+    frames = []
+    for file_name in sorted(os.listdir(image_dir)):
+        if file_name.lower().endswith(('.png', '.jpg', '.jpeg')):
+            frame = cv2.imread(os.path.join(image_dir, file_name))
+            if frame is not None:
+                frames.append(frame)
+    return frames
+
+
+def synthetic_frames(count, seed=0):
+    # Distinct images, each gets its own deterministic result from the mock backend
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 256, size=(*FRAME_SIZE, 3), dtype=np.uint8) for _ in range(count)]
+
+
+class Kiosk(threading.Thread):
+    # One installation: sends a snapshot, waits for the grid, now and then uploads a spritesheet
+    def __init__(self, kiosk_id, frames, deadline, think_time, sprites_every, results):
+        super().__init__(name=f"kiosk-{kiosk_id}", daemon=True)
+        self.rng = random.Random(kiosk_id)
+        self.frames = frames
+        self.deadline = deadline
+        self.think_time = think_time
+        self.sprites_every = sprites_every
+        self.results = results
+
+    def timed(self, kind, request):
+        # A request that raises counts as a failure, the kiosk carries on with the next one
+        start = time.perf_counter()
+        try:
+            success = request()
+        except Exception as e:
+            with errors_lock:
+                errors[f"{kind}: {type(e).__name__}"] += 1
+            success = False
+        self.results.append((kind, time.perf_counter() - start, success))
+
+    def upload(self, crops, bboxes):
+        result = asyncio.run(send_frames_to_backend(crops, bboxes))
+        return bool(result and result.get('success'))
+
+    def run(self):
+        matches = 0
+        while time.time() < self.deadline:
+            frame = self.rng.choice(self.frames)
+            self.timed('match', lambda: send_snapshot_to_server(frame)[2])
+            matches += 1
+
+            if self.sprites_every and matches % self.sprites_every == 0:
+                crops = [cv2.resize(frame, (100, 100))] * SPRITESHEET_FRAMES
+                bboxes = [[0, 0, 100, 100]] * SPRITESHEET_FRAMES
+                self.timed('spritesheet', lambda: self.upload(crops, bboxes))
+            if self.think_time:
+                time.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+
+def report(kind, results, elapsed):
+    latencies = [latency for k, latency, _ in results if k == kind]
+    if not latencies:
+        return
+    succeeded = sum(1 for k, _, success in results if k == kind and success)
+    print(f"{kind}: {len(latencies)} requests, {succeeded / len(latencies):.1%} succeeded, {len(latencies) / elapsed:.1f} req/s")
+    print(f"  latency ms: p50={percentile_ms(latencies, 50):.0f} p90={percentile_ms(latencies, 90):.0f} "
+          f"p95={percentile_ms(latencies, 95):.0f} p99={percentile_ms(latencies, 99):.0f} max={max(latencies) * 1000:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the match path with N concurrent simulated kiosks')
+    parser.add_argument('--kiosks', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds to run')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean seconds a kiosk waits between matches')
+    parser.add_argument('--sprites-every', type=int, default=0, help='Upload a spritesheet every N matches per kiosk, 0 for never')
+    parser.add_argument('--images', help='Folder of frames to send, synthetic frames otherwise')
+    parser.add_argument('--url', default=backend_communicator.BASE_SERVER_URL)
+    parser.add_argument('--mock', choices=sorted(PROFILES), help='Start the mock backend with this profile on --url')
+    parser.add_argument('--base', default=DATABASE_DIR, help='Fixture database for the mock backend')
+    parser.add_argument('--workers', type=int, default=1, help='Requests the mock backend serves at once')
+    parser.add_argument('--num-vids', type=int, default=backend_communicator.GRID_NUM_VIDS, help='Matches requested per side, the grid size')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    backend_communicator.BASE_SERVER_URL = args.url
+    config.create_sprites = True
+    config.num_vids = args.num_vids  # Set by ImageApp in the app
+    backend = start_mock_backend(args.url, args.mock, args.base, args.seed, args.workers) if args.mock else None
+    frames = load_frames(args.images) if args.images else synthetic_frames(SYNTHETIC_FRAMES, args.seed)
+    if not frames:
+        print(f"No frames in {args.images}")
+        return
+
+    results = []
+    start_time = time.time()
+    kiosks = [Kiosk(i, frames, start_time + args.duration, args.think_time, args.sprites_every, results) for i in range(args.kiosks)]
+    for kiosk in kiosks:
+        kiosk.start()
+    for kiosk in kiosks:
+        kiosk.join()
+    elapsed = time.time() - start_time
+
+    print(f"\n{args.kiosks} kiosks for {elapsed:.1f} s against {args.url}{f' (mock, {args.mock})' if args.mock else ''}")
+    report('match', results, elapsed)
+    report('spritesheet', results, elapsed)
+    with snapshot_stats_lock:
+        outcomes = ', '.join(f"{name}={count}" for name, count in sorted(snapshot_stats.items()))
+    print(f"Outcomes: {outcomes}")
+    if errors:
+        print(f"Exceptions: {', '.join(f'{name}={count}' for name, count in sorted(errors.items()))}")
+    if backend is not None:
+        print(f"Mock backend: {', '.join(f'{name}={count}' for name, count in sorted(backend.stats.items()))}")
+
+
+if __name__ == '__main__':
+    main()
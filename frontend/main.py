@@ -1,12 +1,29 @@
 import sys
 import asyncio
-from PyQt5.QtWidgets import QApplication
-from image_app import ImageApp
-from backend_communicator import preload_images  # Assume this is the module where preload_images function is defined
+
+# The app is imported inside main(): the spawned detection worker re-runs this module's top level,
+# and should not start new_faces' threads or load Qt
 
 async def main():
+    from PyQt5.QtWidgets import QApplication
+    from image_app import ImageApp
+    from backend_communicator import preload_images  # Assume this is the module where preload_images function is defined
+    from descriptor_index import descriptor_index
+    from embedder import create_embedder
+    from session_trace import tracer
+    import config
+
     # Step 1: Preload images
     preloaded_images = await preload_images()
+    if config.embedder == 'onnx':
+        embedder = create_embedder()
+        if embedder is not None:
+            descriptor_index.set_embedder(embedder)
+    if config.local_matching or descriptor_index.embedder is not None:
+        descriptor_index.start_loading()
+
+    if config.trace_path:
+        tracer.start_recording(config.trace_path)
 
     # Step 2: Create the Qt Application and the main window
     app = QApplication(sys.argv)
@@ -28,6 +45,8 @@ async def main():
     if hasattr(window, 'overlay') and window.overlay is not None:
         window.overlay.close()
 
+    tracer.stop()
+
     sys.exit(exit_code)
 
 if __name__ == "__main__":
@@ -0,0 +1,132 @@
+import time
+import threading
+import numpy as np
+from collections import OrderedDict, Counter
+from logger_setup import logger
+import config
+
+MAX_ENTRIES = 256
+QUANT_STEP = 0.05  # Descriptor cell size, near-identical descriptors share a cell and replace each other
+
+
+class CachedMatch:
+    def __init__(self, most_similar, least_similar, descriptor, latency):
+        self.most_similar = most_similar
+        self.least_similar = least_similar
+        self.descriptor = descriptor
+        self.latency = latency  # What the backend round trip cost when this was fetched
+        self.stored_at = time.time()
+
+
+def quantize(descriptor):
+    return np.round(descriptor / QUANT_STEP).astype(np.int16).tobytes()
+
+
+class MatchCache:
+    # Recent /get-matches results, found again by face track ID or by a descriptor within
+    # config.match_cache_tolerance of the cached one. Entries expire after config.match_cache_ttl
+    # seconds and the least recently used go first once MAX_ENTRIES is reached.
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # quantized descriptor (or track key) -> CachedMatch
+        self.tracks = {}  # track id -> entry key
+        self.stats = Counter()
+        self.saved_latency = 0.0
+
+    def expired(self, entry):
+        return time.time() - entry.stored_at > config.match_cache_ttl
+
+    def put(self, most_similar, least_similar, descriptor=None, track_id=None, latency=0.0):
+        if descriptor is None and track_id is None:
+            return
+        if descriptor is not None:
+            descriptor = np.asarray(descriptor, dtype=np.float32).reshape(-1)
+            key = quantize(descriptor)
+        else:
+            key = ('track', track_id)
+        with self.lock:
+            # A result this cache served itself stays the one entry with its original age, so
+            # repeated hits never extend the TTL
+            served = next((k for k, e in self.entries.items() if e.most_similar is most_similar), None)
+            if served is not None:
+                key = served
+            else:
+                self.entries[key] = CachedMatch(most_similar, least_similar, descriptor, latency)
+            self.entries.move_to_end(key)
+            if track_id is not None:
+                self.tracks[track_id] = key
+            while len(self.entries) > self.max_entries:
+                evicted, _ = self.entries.popitem(last=False)
+                self.stats['evicted'] += 1
+                self.tracks = {t: k for t, k in self.tracks.items() if k != evicted}
+
+    def lookup_track(self, track_id):
+        # Called with the lock held
+        key = self.tracks.get(track_id)
+        entry = self.entries.get(key) if key is not None else None
+        return key, entry
+
+    def lookup_descriptor(self, descriptor):
+        # Called with the lock held. The descriptor's own cell first, then every cached descriptor,
+        # a few hundred rows is cheaper to scan than probing the neighbouring cells of 128 dimensions.
+        key = quantize(descriptor)
+        entry = self.entries.get(key)
+        if entry is not None and np.linalg.norm(entry.descriptor - descriptor) <= config.match_cache_tolerance:
+            return key, entry
+        keys = [k for k, e in self.entries.items() if e.descriptor is not None]
+        if not keys:
+            return None, None
+        matrix = np.stack([self.entries[k].descriptor for k in keys])
+        distances = np.linalg.norm(matrix - descriptor, axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > config.match_cache_tolerance:
+            return None, None
+        return keys[best], self.entries[keys[best]]
+
+    def get(self, track_id=None, descriptor=None):
+        if not config.match_cache:
+            return None
+        with self.lock:
+            self.stats['lookups'] += 1
+            key, entry, kind = None, None, None
+            if track_id is not None:
+                key, entry = self.lookup_track(track_id)
+                kind = 'track_hits'
+            if entry is None and descriptor is not None:
+                descriptor = np.asarray(descriptor, dtype=np.float32).reshape(-1)
+                key, entry = self.lookup_descriptor(descriptor)
+                kind = 'descriptor_hits'
+            if entry is not None and self.expired(entry):
+                del self.entries[key]
+                self.stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self.stats['misses'] += 1
+                return None
+
+            self.entries.move_to_end(key)
+            if track_id is not None:
+                # The same visitor under a new track ID is found by track next time
+                self.tracks[track_id] = key
+            self.stats[kind] += 1
+            self.saved_latency += entry.latency
+            return entry
+
+    def has_track(self, track_id):
+        with self.lock:
+            _, entry = self.lookup_track(track_id)
+            return entry is not None and not self.expired(entry)
+
+    def log_stats(self):
+        with self.lock:
+            hits = self.stats['track_hits'] + self.stats['descriptor_hits']
+            lookups = self.stats['lookups']
+            hit_rate = hits / lookups if lookups else 0.0
+            stats = ', '.join(f"{name}={count}" for name, count in sorted(self.stats.items()))
+            saved = self.saved_latency
+            size = len(self.entries)
+        logger.info(f"Match cache: {size} entries, hit rate={hit_rate:.1%}, {stats}, saved backend time={saved:.1f} s")
+
+
+match_cache = MatchCache()
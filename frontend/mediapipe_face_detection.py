@@ -1,70 +1,113 @@
-import cv2
+import time
 import mediapipe as mp
-from new_faces import set_curr_face
-import math
+from collections import Counter
+from new_faces import set_curr_face, set_pose_check
+from detection_worker import DetectionWorkerClient
+from detection_result import tuples_to_result
+from bbox_tracker import TemplateTracker
+from face_tracker import MultiFaceTracker
+from pose_estimator import PoseEstimator
+from frame_views import as_frame
+from session_trace import tracer
+from logger_setup import logger
+import config
 
 class MediaPipeFaceDetection:
-    def __init__(self):
+    def __init__(self, use_process=None):
+        self.use_process = config.detection_process if use_process is None else use_process
         self.mp_face_detection = mp.solutions.face_detection
-        self.face_detection = self.mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5)
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.face_mesh = self.mp_face_mesh.FaceMesh(static_image_mode=False, max_num_faces=1, min_detection_confidence=0.5)
+        if self.use_process:
+            # Detection runs in a child process, frames go through shared memory and only bboxes come back
+            self.face_detection = None
+            self.detection_worker = DetectionWorkerClient(model_selection=1, min_detection_confidence=0.5)
+        else:
+            self.face_detection = self.mp_face_detection.FaceDetection(model_selection=1, min_detection_confidence=0.5)
+            self.detection_worker = None
         self.current_face_bbox = None  # Store the current face's bounding box
+        # FaceMesh only loads once the first pose check needs it
+        self.pose_estimator = PoseEstimator()
+        set_pose_check(self.pose_estimator.is_facing_forward)
+
+        # Full detection runs every config.detect_every_n frames, the tracker fills in between
+        self.tracker = TemplateTracker()
+        # Stable IDs for every face in view, one of them locked as the current visitor
+        self.face_tracker = MultiFaceTracker()
+        self.frames_since_detection = 0
+        self.stats = Counter()
+        self.stats_since = time.time()
+
+    def run_detection(self, frame, detection_width=None):
+        # MediaPipe bboxes are relative to the image, and the downscale keeps the aspect ratio, so they
+        # map straight back onto the full-resolution frame used for cropping and the preview
+        if detection_width is None:
+            detection_width = config.detection_width
+        frame = as_frame(frame)
+        if self.detection_worker is not None:
+            return self.detection_worker.process_frame(frame.resized(detection_width))
+        return self.face_detection.process(frame.rgb(detection_width))
+
+    def detect_or_track(self, frame):
+        detect_every_n = config.detect_every_n
+        if detect_every_n > 1 and self.tracker.active and self.frames_since_detection < detect_every_n:
+            bbox, confidence = self.tracker.track(frame)
+            if bbox is not None and confidence >= config.tracking_min_confidence:
+                self.frames_since_detection += 1
+                self.stats['tracked'] += 1
+                h, w = frame.shape[:2]
+                return tuples_to_result([(bbox[0] / w, bbox[1] / h, bbox[2] / w, bbox[3] / h, confidence)]), True
+            # Tracking confidence dropped, fall back to a full detection on this frame
+            self.stats['track_lost'] += 1
+
+        self.frames_since_detection = 1
+        self.stats['detected'] += 1
+        return self.run_detection(frame), False
 
     def detect_faces(self, frame, callback):
-        results = self.face_detection.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        closest_face = None
-        min_distance = float('inf')
+        # Accepts a plain BGR array or a Frame carrying shared views, and hands back what it was given
+        frame_views = as_frame(frame)
+        results, tracked = self.detect_or_track(frame_views)
+        h, w = frame_views.shape[:2]
 
+        boxes, scores = [], []
         if results.detections:
             for detection in results.detections:
                 bboxC = detection.location_data.relative_bounding_box
-                h, w, c = frame.shape
-                bbox = int(bboxC.xmin * w), int(bboxC.ymin * h), \
-                    int(bboxC.width * w), int(bboxC.height * h)
-                
-                # Calculate the distance of the face from the camera
-                face_center_x = bbox[0] + bbox[2] // 2
-                face_center_y = bbox[1] + bbox[3] // 2
-                distance = (face_center_x - w // 2) ** 2 + (face_center_y - h // 2) ** 2
-                
-                # Find the closest face to the camera initially
-                if self.current_face_bbox is None and distance < min_distance:
-                    min_distance = distance
-                    closest_face = bbox
-                
-                # Stick to the current face if it is still detected
-                if self.current_face_bbox is not None and \
-                   self.current_face_bbox[0] <= face_center_x <= self.current_face_bbox[0] + self.current_face_bbox[2] and \
-                   self.current_face_bbox[1] <= face_center_y <= self.current_face_bbox[1] + self.current_face_bbox[3]:
-                    closest_face = bbox
-                    break
+                boxes.append((int(bboxC.xmin * w), int(bboxC.ymin * h), int(bboxC.width * w), int(bboxC.height * h)))
+                scores.append(detection.score[0] if detection.score else 1.0)
 
-            # Update the current face's bounding box
-            if closest_face is not None:
-                self.current_face_bbox = closest_face
-            else:
-                self.current_face_bbox = None  # No valid face detected
+        if tracked:
+            # The template tracker only follows the locked face
+            track = self.face_tracker.update_locked(boxes[0], scores[0])
         else:
-            self.current_face_bbox = None  # No face detected at all
+            self.face_tracker.update(boxes, scores)
+            track = self.face_tracker.primary(frame_views.shape)
+            self.pose_estimator.retain({t.id for t in self.face_tracker.tracks})
 
-        # Call set_curr_face with the results, frame, and callback
-        set_curr_face(results, frame, callback)
+        self.current_face_bbox = track.bbox if track is not None else None
+        tracer.detection(self.current_face_bbox, track.id if track is not None else None)
 
-        return frame, self.current_face_bbox
+        if not tracked:
+            if self.current_face_bbox is not None:
+                self.tracker.init(frame_views, self.current_face_bbox)
+            else:
+                self.tracker.reset()
 
-    def is_face_facing_forward(self, frame):
-        results = self.face_mesh.process(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
-        if results.multi_face_landmarks:
-            for face_landmarks in results.multi_face_landmarks:
-                nose_tip = face_landmarks.landmark[self.mp_face_mesh.FACEMESH_NOSE_TIP]
-                left_cheek = face_landmarks.landmark[self.mp_face_mesh.FACEMESH_LEFT_CHEEK]
-                right_cheek = face_landmarks.landmark[self.mp_face_mesh.FACEMESH_RIGHT_CHEEK]
+        # new_faces captures and matches the same locked track, other faces in the frame are ignored
+        set_curr_face(results if track is not None else None, frame_views.bgr, callback, track)
+
+        return frame, self.current_face_bbox
 
-                # Calculate the angles to check if the face is within 45 degrees
-                angle_left = math.degrees(math.atan2(nose_tip.y - left_cheek.y, nose_tip.x - left_cheek.x))
-                angle_right = math.degrees(math.atan2(nose_tip.y - right_cheek.y, nose_tip.x - right_cheek.x))
+    def log_stats(self):
+        elapsed = max(time.time() - self.stats_since, 1e-6)
+        frames = self.stats['detected'] + self.stats['tracked']
+        logger.info(f"Face detection: {frames / elapsed:.1f} frames/s, {self.stats['detected'] / elapsed:.1f} detections/s, "
+                    f"{self.stats['tracked']} tracked, {self.stats['track_lost']} tracking losses, "
+                    f"face tracks created={self.face_tracker.stats['created']}, locks={self.face_tracker.stats['locked']}")
+        self.pose_estimator.log_stats()
+        self.stats.clear()
+        self.stats_since = time.time()
 
-                if abs(angle_left) <= 60 and abs(angle_right) <= 60:
-                    return True
-        return False
+    def close(self):
+        if self.detection_worker is not None:
+            self.detection_worker.close()
+        self.pose_estimator.close()
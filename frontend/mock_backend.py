@@ -0,0 +1,220 @@
+import os
+import json
+import random
+import asyncio
+import hashlib
+import argparse
+from collections import Counter
+import numpy as np
+from logger_setup import logger
+from descriptor_store import DATABASE_DIR, DESCRIPTOR_SIZE, read_descriptor_folder, list_folders
+
+# Stand-in for the Node backend, enough of its API to load-test the frontend without TensorFlow.
+# Matches are deterministic: the same image always gets the same descriptor and the same result.
+# Usage: python mock_backend.py --profile typical
+#        python mock_backend.py --latency 300 --jitter 100 --error-rate 0.05 --workers 1
+
+PROFILES = {
+    # latency and jitter in ms, rates as fractions of match requests
+    'instant': {'latency': 0, 'jitter': 0, 'error_rate': 0.0, 'no_face_rate': 0.0},
+    'typical': {'latency': 180, 'jitter': 60, 'error_rate': 0.0, 'no_face_rate': 0.05},
+    'slow': {'latency': 800, 'jitter': 300, 'error_rate': 0.0, 'no_face_rate': 0.05},
+    'flaky': {'latency': 250, 'jitter': 150, 'error_rate': 0.1, 'no_face_rate': 0.15},
+}
+SPRITESHEET_FACTOR = 4  # /create-spritesheet runs face-api on the tiles and encodes a large JPEG
+QUERY_NOISE = 0.05  # Spread of a mock descriptor around the fixture row it was derived from
+SYNTHETIC_FOLDERS = 1000  # Used when the fixture database has no descriptors
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+
+
+class MockBackend:
+    def __init__(self, base_dir=DATABASE_DIR, latency=0, jitter=0, error_rate=0.0, no_face_rate=0.0, workers=1, seed=0):
+        self.base_dir = base_dir
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.no_face_rate = no_face_rate
+        self.rng = random.Random(seed)
+        # The real backend runs one TensorFlow model at a time, requests beyond this queue
+        self.workers = asyncio.Semaphore(workers) if workers else None
+        self.stats = Counter()
+        self.load_fixture()
+
+    def load_fixture(self):
+        folders, descriptors, entries = [], [], []
+        try:
+            names = list_folders(self.base_dir)
+        except OSError:
+            names = []
+        for name in names:
+            loaded = read_descriptor_folder(self.base_dir, name)
+            if loaded is not None:
+                folders.append(name)
+                descriptors.append(loaded[0])
+                entries.append([{'path': os.path.join('..', 'database0', name, 'spritesheet', file_name),
+                                 'numImages': int(file_name.split('.')[0]) if file_name.split('.')[0].isdigit() else None}
+                                for file_name in loaded[1]])
+        if not folders:
+            logger.warning(f"Mock backend: no descriptors in {self.base_dir}, serving {SYNTHETIC_FOLDERS} synthetic folders")
+            rng = np.random.default_rng(0)
+            descriptors = rng.normal(0, 0.1, size=(SYNTHETIC_FOLDERS, DESCRIPTOR_SIZE))
+            folders = [f"X#mock-{i:05d}" for i in range(SYNTHETIC_FOLDERS)]
+            entries = [[{'path': os.path.join('..', 'database0', folder, 'spritesheet', '50.100.100.jpg'), 'numImages': 50}]
+                       for folder in folders]
+        self.folders = folders
+        self.matrix = np.asarray(descriptors, dtype=np.float64)
+        self.entries = entries
+        logger.info(f"Mock backend: {len(folders)} folders in the fixture")
+
+    def descriptor_for(self, image):
+        # Near one fixture row, picked by the image's hash, so results look like a returning visitor's
+        digest = hashlib.sha256(image.encode('utf-8')).digest()
+        seed = int.from_bytes(digest[:8], 'little')
+        rng = np.random.default_rng(seed)
+        row = seed % len(self.matrix)
+        return self.matrix[row] + rng.normal(0, QUERY_NOISE, DESCRIPTOR_SIZE), seed
+
+    def find_similar(self, descriptor, num_vids):
+        # Same shape as findSimilarImages: every spritesheet of the ranked folders with its distance
+        distances = np.sqrt(((self.matrix - descriptor) ** 2).sum(axis=1))
+        order = np.argsort(distances, kind='stable')
+        ranked = [dict(entry, distance=float(distances[row])) for row in order for entry in self.entries[row]]
+        return ranked[:num_vids], ranked[-num_vids:][::-1]
+
+    def face_found(self, seed):
+        # Decided by the image, so the same frame is always either a face or not
+        return (seed >> 32) % 10000 >= self.no_face_rate * 10000
+
+    async def delay(self, factor=1.0):
+        latency = max(0.0, self.rng.gauss(self.latency, self.jitter)) * factor
+        if self.workers is None:
+            await asyncio.sleep(latency)
+            return
+        async with self.workers:
+            await asyncio.sleep(latency)
+
+    def injected_error(self):
+        return self.rng.random() < self.error_rate
+
+    async def route(self, method, path, body):
+        if method == 'POST' and path in ('/get-matches', '/get-descriptor', '/get-matches-batch'):
+            request = json.loads(body or b'{}')
+            await self.delay(len(request.get('images') or [None]))
+            if self.injected_error():
+                return 500, {'error': 'Internal server error'}
+            return self.match(path, request)
+        if method == 'POST' and path == '/create-spritesheet':
+            await self.delay(SPRITESHEET_FACTOR)
+            if self.injected_error():
+                return 500, {'success': False, 'error': 'Injected error'}
+            frames = body.count(b'name="frames"')
+            if not frames:
+                return 400, {'error': 'Files not provided or invalid'}
+            self.stats['spritesheets'] += 1
+            # A folder that does not exist, the frontend's add_folder just skips it
+            folder = f"X#mock-upload-{self.stats['spritesheets']:05d}"
+            return 200, {'success': True, 'filePath': os.path.join('..', 'database0', folder, 'spritesheet', f"{frames}.100.100.jpg")}
+        if method == 'GET' and path == '/preload-images':
+            return 200, {'images': [entry['path'] for entries in self.entries for entry in entries]}
+        if method == 'POST' and path == '/grid-info':
+            return 200, {'message': 'Grid info received successfully'}
+        return 404, {'error': f"Cannot {method} {path}"}
+
+    def match(self, path, request):
+        num_vids = request.get('numVids')
+        descriptor_only = path == '/get-descriptor' or request.get('descriptorOnly')
+        if not descriptor_only and not num_vids:
+            return 400, {'error': 'Number of videos in grid not provided'}
+        images = request.get('images') if path == '/get-matches-batch' else [request.get('image')]
+        if not images or not all(images):
+            return 400, {'error': 'No image data provided'}
+
+        found = [self.descriptor_for(image) for image in images]
+        found = [descriptor for descriptor, seed in found if self.face_found(seed)]
+        if not found:
+            self.stats['no_face'] += 1
+            return 404, {'error': 'No face detected'}
+        descriptor = np.mean(found, axis=0)
+        if len(found) > 1:
+            descriptor *= np.mean([np.linalg.norm(d) for d in found]) / np.linalg.norm(descriptor)
+
+        self.stats['matches'] += 1
+        result = {'descriptor': descriptor.tolist()}
+        if path == '/get-matches-batch':
+            result['used'] = len(found)
+        if not descriptor_only:
+            result['mostSimilar'], result['leastSimilar'] = self.find_similar(descriptor, int(num_vids))
+        return 200, result
+
+    async def handle(self, reader, writer):
+        # Just enough HTTP/1.1 for httpx: Content-Length bodies and keep-alive
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                self.stats['requests'] += 1
+                try:
+                    status, payload = await self.route(method, target.split('?')[0], body)
+                except ValueError as e:
+                    status, payload = 400, {'error': f"Invalid request: {e}"}
+                self.stats[f"status_{status}"] += 1
+                data = json.dumps(payload).encode('utf-8')
+                writer.write(f"HTTP/1.1 {status} {REASONS.get(status, 'Error')}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\nConnection: keep-alive\r\n\r\n".encode('latin-1') + data)
+                await writer.drain()
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='localhost', port=3000, ready=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        logger.info(f"Mock backend listening on http://{host}:{port}")
+        if ready is not None:
+            ready.set()
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the backend API from a fixture database without TensorFlow')
+    parser.add_argument('--base', default=DATABASE_DIR, help='Fixture database folder')
+    parser.add_argument('--port', type=int, default=3000)
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='typical')
+    parser.add_argument('--latency', type=float, help='Mean match latency in ms, overrides the profile')
+    parser.add_argument('--jitter', type=float, help='Standard deviation of the latency in ms')
+    parser.add_argument('--error-rate', type=float, help='Fraction of requests answered with a 500')
+    parser.add_argument('--no-face-rate', type=float, help='Fraction of images answered with 404 No face detected')
+    parser.add_argument('--workers', type=int, default=1, help='Requests served at once, 0 for unlimited')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    profile = dict(PROFILES[args.profile])
+    for key in profile:
+        if getattr(args, key) is not None:
+            profile[key] = getattr(args, key)
+    backend = MockBackend(args.base, workers=args.workers, seed=args.seed, **profile)
+    try:
+        asyncio.run(backend.serve(port=args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stats = ', '.join(f"{name}={count}" for name, count in sorted(backend.stats.items()))
+        print(f"Mock backend: {stats}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import cv2
+import time
+from logger_setup import logger
+from frame_views import as_frame
+
+MOTION_WIDTH = 160  # Motion is checked on a tiny grayscale copy of the frame
+PIXEL_THRESHOLD = 25  # Per-pixel intensity change that counts as movement
+MIN_CHANGED_FRACTION = 0.01  # Share of pixels that must change to count as motion
+RAPL_ENERGY_FILE = '/sys/class/powercap/intel-rapl:0/energy_uj'
+
+
+class MotionGate:
+    def __init__(self, width=MOTION_WIDTH, pixel_threshold=PIXEL_THRESHOLD, min_changed_fraction=MIN_CHANGED_FRACTION):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.previous = None
+
+    def check(self, frame):
+        gray = cv2.GaussianBlur(as_frame(frame).gray(self.width), (5, 5), 0)
+        previous, self.previous = self.previous, gray
+        if previous is None or previous.shape != gray.shape:
+            return False
+        diff = cv2.absdiff(gray, previous)
+        changed = cv2.countNonZero(cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1])
+        return changed >= self.min_changed_fraction * gray.size
+
+    def reset(self):
+        self.previous = None
+
+
+def read_energy_uj():
+    # Package energy counter on Intel machines, None where it is missing or not readable
+    try:
+        with open(RAPL_ENERGY_FILE) as energy_file:
+            return int(energy_file.read())
+    except (OSError, ValueError):
+        return None
+
+
+class UsageMeter:
+    # Wall time, process CPU time and (where available) package energy spent in each pipeline mode
+    def __init__(self, mode):
+        self.mode = mode
+        self.totals = {}
+        self.mark()
+
+    def mark(self):
+        self.wall_start = time.time()
+        self.cpu_start = time.process_time()
+        self.energy_start = read_energy_uj()
+
+    def accumulate(self):
+        wall, cpu, energy = self.totals.get(self.mode, (0.0, 0.0, None))
+        wall += time.time() - self.wall_start
+        cpu += time.process_time() - self.cpu_start
+        energy_now = read_energy_uj()
+        if self.energy_start is not None and energy_now is not None and energy_now >= self.energy_start:
+            energy = (energy or 0.0) + (energy_now - self.energy_start) / 1e6
+        self.totals[self.mode] = (wall, cpu, energy)
+        self.mark()
+
+    def switch(self, mode):
+        self.accumulate()
+        self.mode = mode
+
+    def report(self):
+        self.accumulate()
+        for mode, (wall, cpu, energy) in sorted(self.totals.items()):
+            if wall <= 0:
+                continue
+            hours = wall / 3600.0
+            line = f"{mode}: {wall / 60:.1f} min, CPU {cpu / hours:.0f} s/h ({cpu / wall:.0%} of one core)"
+            if energy is not None:
+                line += f", {energy / 3600.0 / hours:.1f} Wh/h"
+            logger.info(f"Pipeline usage {line}")
@@ -1,200 +1,467 @@
 import cv2
+import os
 import numpy as np
-from backend_communicator import send_snapshot_to_server, send_frames_to_backend
+from backend_communicator import match_face, send_frames_to_backend, CancelToken, snapshot_stats, snapshot_stats_lock
 from logger_setup import logger
 import config
 import threading
 import time
-from concurrent.futures import ThreadPoolExecutor
 import asyncio
+from collections import Counter
+from backend_scheduler import BackendScheduler, INTERACTIVE, BULK
+from snapshot_selector import SnapshotSelector
+from descriptor_index import descriptor_index
+from match_cache import match_cache
+from session_trace import tracer
 
-# Global variables
-curr_face = None
-no_face_counter = 0
-previous_backend_success = True
-awaiting_backend_response = False
-detection_counter = 0
-frame_buffer = []
-bbox_buffer = []
 MAX_FRAMES = 12 * 19
 MIN_FRAMES = 4
-frames_sent = False
-log_no_face_detected = False
-face_detected = False
-mediapipe_last_detection_time = 0
-mediapipe_valid_detection = False
-stop_threads = False
-executor = ThreadPoolExecutor(max_workers=5)
-
-def reset_face():
-    global curr_face, detection_counter, frame_buffer, bbox_buffer, frames_sent
-    curr_face = None
-    detection_counter = 0
-    frame_buffer = []
-    bbox_buffer = []
-    frames_sent = False
-    print("Face reset triggered.")
-    logger.info("Face reset triggered.")
-
-def periodic_reset():
-    if stop_threads:
-        return
-    if mediapipe_valid_detection:
-        reset_face()
-    threading.Timer(config.update_int, periodic_reset).start()
-
-def start_periodic_reset():
-    global stop_threads
-    stop_threads = False
-    if config.auto_update:
-        print(f"Starting periodic reset with interval {config.update_int} seconds.")
-        periodic_reset()
-
-def set_curr_face(mediapipe_result, frame, callback):
-    global curr_face, no_face_counter, detection_counter, frame_buffer, bbox_buffer, frames_sent, log_no_face_detected, face_detected, mediapipe_last_detection_time, mediapipe_valid_detection
-    bbox_multiplier = config.bbox_multiplier
-
-    current_time = time.time()
-
-    if mediapipe_result and mediapipe_result.detections:
-        mediapipe_last_detection_time = current_time
-        mediapipe_valid_detection = True
-
-        log_no_face_detected = False
-        face_detected = True
-
-        no_face_counter = 0
-        detection_counter += 1
+CONFIRM_FRAMES = 10  # Consecutive detections before a face counts as a new visitor
+LOST_FRAMES = 10  # Consecutive misses before the visitor counts as gone
+MAX_MATCH_RETRIES = 3
+SPECULATIVE_MAX_AGE = 3.0  # Seconds a speculative result stays usable for the confirmation
+MAX_QUEUED_UPLOADS = 3  # Spritesheet uploads waiting behind the running one, each holds up to MAX_FRAMES crops
+POSE_WAIT_FRAMES = 20  # Extra frames the confirmation waits for a frontal pose before taking the best it has
+
+# Session states
+IDLE = 'idle'              # Nobody in front of the camera
+DETECTING = 'detecting'    # Face seen, waiting for CONFIRM_FRAMES consecutive detections
+MATCHING = 'matching'      # Snapshot sent to /get-matches, capturing frames meanwhile
+CAPTURING = 'capturing'    # Matches received (or given up on), still capturing frames
+SENT = 'sent'              # Frames handed to the upload lane, waiting for the next reset
+
+TRANSITIONS = {
+    IDLE: {DETECTING},
+    DETECTING: {IDLE, MATCHING},
+    MATCHING: {IDLE, CAPTURING, SENT},
+    CAPTURING: {IDLE, MATCHING, SENT},
+    SENT: {IDLE},
+}
+
+# Match requests get their own lane so a slow spritesheet upload never holds up the next visitor
+scheduler = BackendScheduler(max_workers=3)
+scheduler.add_lane(INTERACTIVE, priority=0, max_concurrency=2)
+scheduler.add_lane(BULK, priority=1, max_concurrency=1, max_queued=MAX_QUEUED_UPLOADS)
+scheduler.start()
+
+
+class FaceSession:
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+        self.lock = threading.RLock()
+        self.state = IDLE
+        self.transition_counts = Counter()
+
+        # Every face session gets a new generation, responses for an older one are dropped
+        self.generation = 0
+        self.curr_face = None
+        self.detection_counter = 0
+        self.no_face_counter = 0
+        self.match_retries = 0
+        self.frame_buffer = []
+        self.bbox_buffer = []
+        self.pending_match = None  # (future, cancel_token) of the in-flight /get-matches request
+        self.request_counts = Counter()  # Backend requests of this generation by purpose, they name them in session traces
+        self.log_no_face_detected = False
+        self.selector = SnapshotSelector()
+        self.track_id = None  # Face track the session is locked to
+        self.track_changes = 0
+        # Results for faces seen recently, so a periodic reset of a seated visitor skips the backend
+        self.match_cache = match_cache
+
+        # Speculative matching: a snapshot goes out on the first detection and its result is
+        # held here until the CONFIRM_FRAMES confirmation passes
+        self.warm_callback = None
+        self.speculative_sent_at = None
+        self.speculative_result = None  # (most_similar, least_similar, cropped_face)
+        self.confirmed_at = None
+        self.speculative_stats = Counter()
+        self.commit_latency_total = 0.0
+
+        self.stop_event = threading.Event()
+        self.reset_thread = None
+
+    @property
+    def face_present(self):
+        with self.lock:
+            return self.state != IDLE
+
+    def transition(self, new_state, reason):
+        # Called with the lock held
+        if new_state not in TRANSITIONS[self.state]:
+            logger.error(f"Invalid face session transition {self.state} -> {new_state} ({reason})")
+            return False
+        self.transition_counts[f"{self.state}->{new_state}"] += 1
+        logger.info(f"Face session {self.generation}: {self.state} -> {new_state} ({reason})")
+        self.state = new_state
+        return True
+
+    def on_detection(self, mediapipe_result, frame, callback, track=None):
+        if track is not None:
+            cropped_face, bbox = self.crop_face(track.bbox, frame)
+            self.on_face(frame, cropped_face, bbox, callback, track.score, track.id)
+        elif mediapipe_result and mediapipe_result.detections:
+            detection = mediapipe_result.detections[0]
+            confidence = detection.score[0] if detection.score else 1.0
+            bboxC = detection.location_data.relative_bounding_box
+            ih, iw, _ = frame.shape
+            face_bbox = int(bboxC.xmin * iw), int(bboxC.ymin * ih), int(bboxC.width * iw), int(bboxC.height * ih)
+            cropped_face, bbox = self.crop_face(face_bbox, frame)
+            self.on_face(frame, cropped_face, bbox, callback, confidence)
+        else:
+            self.on_no_face()
 
-        detection = mediapipe_result.detections[0]
-        bboxC = detection.location_data.relative_bounding_box
+    def crop_face(self, face_bbox, frame):
+        bbox_multiplier = config.bbox_multiplier
         ih, iw, _ = frame.shape
-        x, y, w, h = int(bboxC.xmin * iw), int(bboxC.ymin * ih), int(bboxC.width * iw), int(bboxC.height * ih)
+        x, y, face_w, face_h = face_bbox
 
-        w = int(w * bbox_multiplier)
+        w = int(face_w * bbox_multiplier)
         h = w
-        cx, cy = x + int(bboxC.width * iw // 2), y + int(bboxC.height * ih // 2)
+        cx, cy = x + face_w // 2, y + face_h // 2
 
         x = max(0, min(cx - w // 2, iw - w))
         y = max(0, min(cy - h // 2, ih - h))
 
         cropped_face = frame[y:y + h, x:x + w]
-
         cropped_face = cv2.resize(cropped_face, (100, 100))
+        return cropped_face, (x, y, w, h)
+
+    def on_face(self, frame, cropped_face, bbox, callback, confidence=1.0, track_id=None):
+        with self.lock:
+            if track_id is not None and track_id != self.track_id:
+                if self.state != IDLE:
+                    # The locked face left and someone else is now being followed
+                    self.track_changes += 1
+                    self.reset('face track changed')
+                self.track_id = track_id
+
+        # Scored outside the lock, the Laplacian is the only real cost here
+        candidate = self.selector.add(frame, cropped_face, bbox, confidence, track_id)
+
+        with self.lock:
+            self.log_no_face_detected = False
+            self.no_face_counter = 0
+
+            if self.state == IDLE:
+                self.transition(DETECTING, 'face detected')
+
+            if self.state == DETECTING:
+                self.detection_counter += 1
+                if config.speculative_match and self.pending_match is None and self.speculative_result is None \
+                        and self.selector.is_good(candidate) and self.selector.is_frontal(candidate) \
+                        and not self.match_cache.has_track(self.track_id):
+                    self.submit_match(frame, cropped_face, callback, speculative=True)
+                if self.detection_counter < CONFIRM_FRAMES:
+                    return
+                if not self.selector.has_frontal() and self.detection_counter < CONFIRM_FRAMES + POSE_WAIT_FRAMES:
+                    # Give the visitor a moment to face the camera before the snapshot is taken
+                    return
+                self.detection_counter = 0
+                best = self.selector.select()
+                extra = self.selector.select_many(config.match_frames, best)
+                self.curr_face = best.cropped_face
+                self.frame_buffer = []
+                self.bbox_buffer = []
+                self.match_retries = 0
+                self.confirm_match(best.frame, best.cropped_face, callback, extra)
+            elif self.state == CAPTURING and self.curr_face is None and self.match_retries < MAX_MATCH_RETRIES:
+                # The last /get-matches failed, retry with the best recent frame
+                self.match_retries += 1
+                self.selector.count('retries')
+                best = self.selector.select()
+                extra = self.selector.select_many(config.match_frames, best)
+                self.submit_match(best.frame, best.cropped_face, callback, extra=extra)
+
+            if self.state in (MATCHING, CAPTURING):
+                # Turned heads make poor spritesheet tiles and throw off the averaged descriptor
+                if not self.selector.is_frontal(candidate):
+                    self.selector.count('capture_skipped_pose')
+                    return
+                if len(self.frame_buffer) < MAX_FRAMES:
+                    self.frame_buffer.append(cropped_face)
+                    self.bbox_buffer.append(bbox)
+
+                # A full buffer waits for the match in MATCHING, SENT would drop it and leave the visitor without a grid
+                if len(self.frame_buffer) >= MAX_FRAMES and self.state == CAPTURING:
+                    self.send_frames()
+
+    def on_no_face(self):
+        with self.lock:
+            self.detection_counter = 0
+            if self.state == IDLE:
+                return
+            self.no_face_counter += 1
+            if self.no_face_counter < LOST_FRAMES:
+                return
+
+            if self.state in (MATCHING, CAPTURING) and len(self.frame_buffer) >= MIN_FRAMES:
+                self.send_frames()
+            self.reset('face lost')
+
+            if not self.log_no_face_detected:
+                print(f'No face detected for {LOST_FRAMES} consecutive frames, resetting curr_face.')
+                logger.info(f"No face detected for {LOST_FRAMES} consecutive frames, resetting curr_face.")
+                self.log_no_face_detected = True
+
+    def reset(self, reason='reset'):
+        with self.lock:
+            self.generation += 1
+            self.request_counts.clear()
+            self.cancel_pending_match()
+            if self.state != IDLE:
+                self.transition(IDLE, reason)
+            self.curr_face = None
+            self.detection_counter = 0
+            self.no_face_counter = 0
+            self.frame_buffer = []
+            self.bbox_buffer = []
+            self.selector.clear()
+            if self.speculative_result is not None:
+                self.speculative_stats['discarded'] += 1
+            self.speculative_result = None
+            self.speculative_sent_at = None
+        print("Face reset triggered.")
+        logger.info("Face reset triggered.")
+
+    def cancel_pending_match(self):
+        # Called with the lock held. Clearing pending_match is what invalidates the request: a
+        # response that still arrives no longer matches it and backend_callback drops it
+        if self.pending_match is not None:
+            future, cancel_token = self.pending_match
+            future.cancel()
+            cancel_token.cancel()
+            self.pending_match = None
+            logger.info("Cancelled in-flight match request.")
+
+    def confirm_match(self, frame, cropped_face, callback, extra=()):
+        # Called with the lock held, once the face has passed CONFIRM_FRAMES detections
+        self.confirmed_at = time.time()
+        speculative_fresh = self.speculative_sent_at is not None and \
+            self.confirmed_at - self.speculative_sent_at <= SPECULATIVE_MAX_AGE
+
+        if self.speculative_result is not None and speculative_fresh:
+            most_similar, least_similar, speculative_face = self.speculative_result
+            self.speculative_result = None
+            self.speculative_stats['hit'] += 1
+            self.transition(MATCHING, 'speculative match ready')
+            self.commit_match(most_similar, least_similar, speculative_face, callback)
+            return
+
+        cached = self.match_cache.get(track_id=self.track_id)
+        if cached is not None:
+            # Same face track as a recent match, the grid gets the cached result without a round trip
+            self.cancel_pending_match()
+            self.speculative_result = None
+            self.transition(MATCHING, 'cached match')
+            self.commit_match(cached.most_similar, cached.least_similar, cropped_face, callback)
+        elif self.pending_match is not None and speculative_fresh:
+            # Still in flight, backend_callback commits it when it lands
+            self.speculative_stats['in_flight'] += 1
+            self.transition(MATCHING, 'waiting for speculative match')
+        else:
+            if self.speculative_sent_at is not None:
+                self.speculative_stats['stale'] += 1
+            self.cancel_pending_match()
+            self.speculative_result = None
+            self.submit_match(frame, cropped_face, callback, extra=extra)
+
+    def commit_match(self, most_similar, least_similar, cropped_face, callback):
+        # Called with the lock held, in MATCHING
+        self.curr_face = cropped_face
+        self.transition(CAPTURING, 'matches received')
+        if self.confirmed_at is not None:
+            self.speculative_stats['committed'] += 1
+            self.commit_latency_total += time.time() - self.confirmed_at
+            self.confirmed_at = None
+        tracer.match()
+        callback(most_similar, least_similar)
+
+    def request_key(self, purpose):
+        # Called with the lock held
+        self.request_counts[purpose] += 1
+        return f"{self.generation}/{purpose}/{self.request_counts[purpose]}"
+
+    def submit_match(self, frame, cropped_face, callback, speculative=False, extra=()):
+        # Called with the lock held. extra are more candidates of the same visitor to fuse with this one.
+        if self.pending_match is not None:
+            return
+
+        if cropped_face is None or not isinstance(cropped_face, np.ndarray):
+            logger.error(f"submit_match: cropped_face is not a valid numpy array. Type: {type(cropped_face)}")
+            return
+
+        if speculative:
+            logger.info("Sending speculative snapshot to server")
+            self.speculative_sent_at = time.time()
+            self.speculative_stats['sent'] += 1
+        else:
+            print('Sending snapshot to server')
+            logger.info("Sending snapshot to server")
+            self.speculative_sent_at = None
+            self.transition(MATCHING, 'snapshot sent')
+        generation = self.generation
+        track_id = self.track_id
+        sent_at = time.time()
+        cancel_token = CancelToken()
+        trace_key = self.request_key('speculative' if speculative else 'match')
 
-        if curr_face is None and detection_counter >= 10:
-            curr_face = cropped_face
-            detection_counter = 0
-            frames_sent = False
-            frame_buffer = []
-            bbox_buffer = []
-
-            update_face_detection(frame, cropped_face, True, callback)
-
-        if curr_face is not None:
-            frame_buffer.append(cropped_face)
-            bbox_buffer.append((x, y, w, h))
-
-            if len(frame_buffer) >= MAX_FRAMES and not frames_sent:
-                send_frames()
-                frames_sent = True
-
-    else:
-        face_detected = False
-        no_face_counter += 1
-        detection_counter = 0
-        mediapipe_valid_detection = False
-        if no_face_counter >= 10:
-            if len(frame_buffer) >= MIN_FRAMES and curr_face is not None and not frames_sent:
-                send_frames()
-                frames_sent = True
-            reset_face()
-
-            if not log_no_face_detected:
-                print('No face detected for 2 consecutive frames, resetting curr_face.')
-                logger.info("No face detected for 2 consecutive frames, resetting curr_face.")
-                log_no_face_detected = True
-
-def update_face_detection(frame, cropped_face, new_face_detected, callback):
-    logger.info("Updating Face Detect")
-
-    global curr_face, previous_backend_success, awaiting_backend_response, frames_sent, face_detected
-
-    if awaiting_backend_response:
-        return
+        def backend_task():
+            return tracer.backend('match', lambda: match_face(
+                [frame] + [c.frame for c in extra], [cropped_face] + [c.cropped_face for c in extra], cancel_token), trace_key)
 
-    if cropped_face is None:
-        logger.error("update_face_detection: cropped_face is None")
-        return
+        def backend_callback(future):
+            with self.lock:
+                if generation != self.generation:
+                    logger.info(f"Dropping match response for stale face session {generation} (current {self.generation}).")
+                    return
+                # A request that was cancelled or replaced within the session must not touch the
+                # replacement's handle or act on the current state
+                if self.pending_match is None or self.pending_match[0] is not future:
+                    logger.info("Dropping match response for a superseded request.")
+                    return
+                self.pending_match = None
+                if future.cancelled() or future.exception() is not None:
+                    success = False
+                else:
+                    most_similar, least_similar, success, descriptor = future.result()
+                    if success:
+                        self.match_cache.put(most_similar, least_similar, descriptor, track_id, time.time() - sent_at)
+
+                if self.state == DETECTING:
+                    # Speculative result, hold it until the confirmation passes
+                    if success:
+                        self.speculative_result = (most_similar, least_similar, cropped_face)
+                        warm_callback = self.warm_callback
+                    else:
+                        # Let the next detection send another speculative snapshot
+                        self.speculative_sent_at = None
+                        return
+                elif self.state == MATCHING:
+                    if success:
+                        self.commit_match(most_similar, least_similar, cropped_face, callback)
+                        return
+                    self.curr_face = None
+                    self.confirmed_at = None
+                    print("Failed to get matches from server, will retry with the next frame.")
+                    logger.warning("Failed to get matches from server, will retry with the next frame.")
+                    self.transition(CAPTURING, 'match failed')
+                    return
+                else:
+                    # Nothing waits for a match in any other state
+                    logger.info(f"Ignoring match response received in state {self.state}.")
+                    return
+
+            # Warm the likely tiles outside the lock, the visitor is not confirmed yet
+            if warm_callback is not None:
+                warm_callback(most_similar, least_similar)
+
+        future = self.scheduler.submit(INTERACTIVE, backend_task)
+        self.pending_match = (future, cancel_token)
+        future.add_done_callback(backend_callback)
 
-    if not isinstance(cropped_face, np.ndarray):
-        logger.error(f"update_face_detection: cropped_face is not a valid numpy array. Type: {type(cropped_face)}")
-        return
+    def send_frames(self):
+        # Called with the lock held
+        if len(self.frame_buffer) < MIN_FRAMES:
+            return
 
-    if new_face_detected or not previous_backend_success:
-        print('Sending snapshot to server')
-        logger.info("Sending snapshot to server")
-        awaiting_backend_response = True
+        # Uploads queue up in the bulk lane, so each one takes its own copy of the buffers
+        frames = list(self.frame_buffer)
+        bboxes = list(self.bbox_buffer)
+        self.transition(SENT, f'{len(frames)} frames captured')
+        trace_key = self.request_key('spritesheet')
 
         def backend_task():
-            most_similar, least_similar, success = send_snapshot_to_server(frame, callback)
-            return most_similar, least_similar, success
+            return tracer.backend('spritesheet', lambda: asyncio.run(send_frames_to_backend(frames, bboxes)), trace_key)
 
         def backend_callback(future):
-            global previous_backend_success, awaiting_backend_response, curr_face
-            most_similar, least_similar, success = future.result()
-            awaiting_backend_response = False
+            success = not future.cancelled() and future.exception() is None and future.result()
+            self.scheduler.log_stats()
 
             if success:
-                previous_backend_success = True
-                curr_face = cropped_face
-                callback(most_similar, least_similar)
+                print("Spritesheet created successfully.")
+                logger.info("Spritesheet created successfully.")
+                ingest_spritesheet(future.result())
+            elif future.cancelled():
+                logger.warning("Spritesheet upload dropped, too many uploads were queued.")
             else:
-                previous_backend_success = False
-                print("Failed to get matches from server, will retry with the next frame.")
-                logger.warning("Failed to get matches from server, will retry with the next frame.")
+                print("Failed to create spritesheet from server.")
+                logger.warning("Failed to create spritesheet from server.")
 
-        future = executor.submit(backend_task)
-        future.add_done_callback(backend_callback)
+        print('Sending frames to server')
+        logger.info(f"Sending frames to server ({self.scheduler.queue_depth(BULK)} uploads already queued)")
 
-def send_frames():
-    global frame_buffer, bbox_buffer, previous_backend_success, awaiting_backend_response
+        future = self.scheduler.submit(BULK, backend_task)
+        future.add_done_callback(backend_callback)
 
-    if awaiting_backend_response:
+    def start_periodic_reset(self):
+        if self.reset_thread is not None and self.reset_thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.reset_thread = threading.Thread(target=self.periodic_reset_loop, name='face-session-reset', daemon=True)
+        self.reset_thread.start()
+
+    def periodic_reset_loop(self):
+        # One long-lived thread instead of a new Timer every update_int, re-reading the interval each time
+        while not self.stop_event.wait(config.update_int):
+            if config.auto_update and self.face_present:
+                self.reset('periodic reset')
+
+    def stop(self):
+        self.stop_event.set()
+
+    def log_stats(self):
+        with self.lock:
+            counts = ', '.join(f"{name}={count}" for name, count in sorted(self.transition_counts.items()))
+            speculative = ', '.join(f"{name}={count}" for name, count in sorted(self.speculative_stats.items()))
+            committed = self.speculative_stats['committed']
+            avg_commit = self.commit_latency_total / committed if committed else 0.0
+        logger.info(f"Face session transitions: {counts}, face track changes={self.track_changes}")
+        logger.info(f"Speculative matches: {speculative}, avg confirm-to-grid latency={avg_commit * 1000:.1f} ms")
+        self.selector.log_stats()
+        self.match_cache.log_stats()
+        with snapshot_stats_lock:
+            sent = snapshot_stats['sent']
+            no_face = snapshot_stats['no_face']
+            outcomes = ', '.join(f"{name}={count}" for name, count in sorted(snapshot_stats.items()))
+        no_face_rate = no_face / sent if sent else 0.0
+        logger.info(f"/get-matches outcomes: {outcomes}, 'No face detected' rate={no_face_rate:.1%}")
+
+
+def ingest_spritesheet(result):
+    # The new visitor becomes matchable right away instead of after the next restart
+    file_path = result.get('filePath') if isinstance(result, dict) else None
+    # The index is only loaded when matching reads it, with local_matching or the onnx embedder
+    if not file_path or not descriptor_index.ready:
         return
+    # filePath is .../database0/<folder>/spritesheet/<file>
+    folder = os.path.basename(os.path.dirname(os.path.dirname(file_path)))
+    descriptor_index.add_folder(folder)
 
-    if not frame_buffer or len(frame_buffer) < MIN_FRAMES:
-        return
 
-    def backend_task():
-        return asyncio.run(send_frames_to_backend(frame_buffer, bbox_buffer))
+session = FaceSession(scheduler)
 
-    def backend_callback(future):
-        global previous_backend_success, awaiting_backend_response, frame_buffer, bbox_buffer
-        success = future.result()
-        previous_backend_success = success
-        awaiting_backend_response = False
+def set_curr_face(mediapipe_result, frame, callback, track=None):
+    session.on_detection(mediapipe_result, frame, callback, track)
 
-        if success:
-            print("Spritesheet created successfully.")
-            logger.info("Spritesheet created successfully.")
-            frame_buffer.clear()
-            bbox_buffer.clear()
-        else:
-            print("Failed to create spritesheet from server, will retry with the next frame.")
-            logger.warning("Failed to create spritesheet from server, will retry with the next frame.")
+def reset_face():
+    session.reset()
+
+def set_warm_callback(warm_callback):
+    session.warm_callback = warm_callback
 
-    print('Sending frames to server')
-    logger.info("Sending frames to server")
-    awaiting_backend_response = True
+def set_pose_check(pose_check):
+    session.selector.pose_check = pose_check
 
-    future = executor.submit(backend_task)
-    future.add_done_callback(backend_callback)
+def start_periodic_reset():
+    if config.auto_update:
+        print(f"Starting periodic reset with interval {config.update_int} seconds.")
+        session.start_periodic_reset()
 
 def stop_all_threads():
-    global stop_threads
-    stop_threads = True
-    executor.shutdown(wait=False)
+    session.stop()
+    session.log_stats()
+    scheduler.shutdown()
 
 # Ensure cleanup on application exit
 import atexit
@@ -23,8 +23,10 @@ class OneEuroFilter:
             self.dx_prev = 0.0
             return x
 
-        # Calculate the time difference
+        # Calculate the time difference, identical timestamps would divide by zero
         te = t - self.t_prev
+        if te <= 0:
+            return self.x_prev
         self.freq = 1.0 / te
 
         # Derivative of the signal
@@ -0,0 +1,101 @@
+import cv2
+import time
+import mediapipe as mp
+import threading
+from collections import Counter
+from logger_setup import logger
+import config
+
+# FaceMesh landmark indices
+NOSE_TIP = 1
+LEFT_CHEEK = 234
+RIGHT_CHEEK = 454
+MIN_YAW_RATIO = 0.5  # Roughly within 30 degrees of facing the camera
+ROI_SIZE = 192  # FaceMesh input size, larger face crops are shrunk to this before the mesh runs
+UNTRACKED = 'untracked'  # Cache key for faces that came without a track ID
+
+
+class PoseEstimator:
+    # Head pose from FaceMesh on the face crop only. The model is created on first use, and each
+    # track is measured at most once per config.pose_interval, every other call gets the cached answer.
+    def __init__(self):
+        self.face_mesh = None
+        self.lock = threading.Lock()
+        self.cache = {}  # track id -> (checked_at, facing_forward)
+        self.stats = Counter()
+
+    def ensure_model(self):
+        # Called with the lock held
+        if self.face_mesh is None:
+            start = time.perf_counter()
+            # Calls are sparse and on different crops, so there is nothing for tracking mode to follow
+            self.face_mesh = mp.solutions.face_mesh.FaceMesh(static_image_mode=True, max_num_faces=1, min_detection_confidence=0.5)
+            logger.info(f"FaceMesh loaded in {(time.perf_counter() - start) * 1000:.0f} ms.")
+        return self.face_mesh
+
+    def crop_roi(self, frame, bbox):
+        ih, iw = frame.shape[:2]
+        x, y, w, h = bbox
+        x0, y0 = max(0, x), max(0, y)
+        x1, y1 = min(iw, x + w), min(ih, y + h)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        roi = frame[y0:y1, x0:x1]
+        if max(roi.shape[:2]) > ROI_SIZE:
+            roi = cv2.resize(roi, (ROI_SIZE, ROI_SIZE), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(roi, cv2.COLOR_BGR2RGB)
+
+    def estimate(self, frame, bbox):
+        roi = self.crop_roi(frame, bbox)
+        if roi is None:
+            return False
+        with self.lock:
+            results = self.ensure_model().process(roi)
+        if not results.multi_face_landmarks:
+            return False
+
+        landmarks = results.multi_face_landmarks[0].landmark
+        nose_tip = landmarks[NOSE_TIP]
+        left_cheek = landmarks[LEFT_CHEEK]
+        right_cheek = landmarks[RIGHT_CHEEK]
+
+        # When the head turns the nose moves towards one cheek, compare the two sides
+        left_span = nose_tip.x - left_cheek.x
+        right_span = right_cheek.x - nose_tip.x
+        if left_span <= 0 or right_span <= 0:
+            return False
+        return min(left_span, right_span) / max(left_span, right_span) >= MIN_YAW_RATIO
+
+    def is_facing_forward(self, frame, bbox, track_id=None):
+        key = UNTRACKED if track_id is None else track_id
+        now = time.monotonic()
+        cached = self.cache.get(key)
+        if cached is not None and now - cached[0] < config.pose_interval:
+            self.stats['cached'] += 1
+            return cached[1]
+
+        start = time.perf_counter()
+        facing_forward = self.estimate(frame, bbox)
+        self.stats['estimated'] += 1
+        self.stats['estimate_ms'] += (time.perf_counter() - start) * 1000
+        self.stats['frontal' if facing_forward else 'turned'] += 1
+        self.cache[key] = (now, facing_forward)
+        return facing_forward
+
+    def retain(self, track_ids):
+        # Forget the pose of tracks that are gone
+        for key in list(self.cache):
+            if key != UNTRACKED and key not in track_ids:
+                del self.cache[key]
+
+    def log_stats(self):
+        estimated = self.stats['estimated']
+        avg_ms = self.stats['estimate_ms'] / estimated if estimated else 0.0
+        logger.info(f"Pose estimation: {estimated} estimated (avg {avg_ms:.1f} ms), {self.stats['cached']} cached, "
+                    f"{self.stats['frontal']} frontal, {self.stats['turned']} turned")
+
+    def close(self):
+        with self.lock:
+            if self.face_mesh is not None:
+                self.face_mesh.close()
+                self.face_mesh = None
@@ -0,0 +1,68 @@
+import threading
+import time
+from collections import Counter
+
+ACK_TIMEOUT = 1.0  # Seconds after which an unacknowledged frame counts as a GUI stall in the stats
+PAINT_SMOOTHING = 0.2  # Weight of the newest paint round trip in the moving average
+
+
+class PreviewChannel:
+    # Hands preview frames to the GUI thread with at most one in flight. Frames offered while the
+    # GUI is still painting the last one replace each other in a single pending slot instead of
+    # piling up as queued signals, and emits are paced to the measured paint round trip. The GUI
+    # acks every frame it receives, so nothing is emitted again until it has, however long it stalls.
+    def __init__(self, signal):
+        self.signal = signal
+        self.lock = threading.Lock()
+        self.in_flight = False
+        self.emitted_at = 0.0
+        self.stall_counted = False
+        self.pending = None
+        self.paint_time = 0.0  # Moving average of emit-to-ack time
+        self.stats = Counter()
+
+    def offer(self, q_img):
+        # Called from the video thread for every processed frame
+        with self.lock:
+            self.stats['offered'] += 1
+            if self.pending is not None:
+                self.stats['coalesced'] += 1
+            self.pending = q_img
+        self.flush()
+
+    def flush(self):
+        # Emits the pending frame once the GUI has caught up, called from the video thread
+        with self.lock:
+            if self.pending is None:
+                return
+            now = time.time()
+            if self.in_flight:
+                if now - self.emitted_at >= ACK_TIMEOUT and not self.stall_counted:
+                    self.stall_counted = True
+                    self.stats['ack_timeouts'] += 1
+                return
+            if now - self.emitted_at < self.paint_time:
+                return
+            q_img, self.pending = self.pending, None
+            self.in_flight = True
+            self.stall_counted = False
+            self.emitted_at = now
+            self.stats['emitted'] += 1
+        self.signal.emit(q_img)
+
+    def ack(self):
+        # Called from the GUI thread once the frame has been painted
+        with self.lock:
+            if not self.in_flight:
+                return
+            self.in_flight = False
+            round_trip = time.time() - self.emitted_at
+            self.paint_time += PAINT_SMOOTHING * (round_trip - self.paint_time)
+            self.stats['painted'] += 1
+
+    def take_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats['paint_ms'] = self.paint_time * 1000
+            self.stats.clear()
+        return stats
@@ -0,0 +1,56 @@
+import os
+import time
+import argparse
+import numpy as np
+from descriptor_index import DescriptorIndex, ann_path
+from descriptor_store import DATABASE_DIR, list_folders
+from embedder import create_embedder, EMBED_TILES
+import config
+
+# Embeds every database folder's spritesheets with a local face recognition model and writes the
+# descriptors to that model's own store next to the face-api one, which stays untouched.
+# Usage: python reembed_database.py --model models/face_recognition_sface_2021dec.onnx
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Re-embed the database with a local face recognition model')
+    parser.add_argument('--base', default=DATABASE_DIR, help='Database folder')
+    parser.add_argument('--model', default=config.embedder_model, help='ONNX face recognition model')
+    parser.add_argument('--tiles', type=int, default=EMBED_TILES, help='Tiles embedded per spritesheet, 0 for all')
+    args = parser.parse_args()
+
+    embedder = create_embedder(args.model)
+    if embedder is None:
+        print(f"Could not load {args.model}, see app.log")
+        return
+
+    index = DescriptorIndex(args.base)
+    index.set_embedder(embedder)
+    start_time = time.time()
+    folders, descriptors, files = [], [], []
+    names = list_folders(args.base)
+    for i, name in enumerate(names):
+        loaded = index.read_folder(name, args.tiles)
+        if loaded is not None:
+            folders.append(name)
+            descriptors.append(loaded[0])
+            files.append(loaded[1])
+        if (i + 1) % 100 == 0:
+            print(f"{i + 1}/{len(names)} folders, {time.time() - start_time:.0f} s")
+
+    store = index.store
+    if store.exists():
+        try:
+            store.load()  # Continues the generation count so the old data file is replaced
+        except (OSError, ValueError, KeyError):
+            pass
+    store.rewrite(folders, np.asarray(descriptors, dtype=np.float32), files)
+    # An index trained on the previous descriptors would probe the wrong lists
+    path = ann_path(args.base, embedder.space)
+    if os.path.exists(path):
+        os.remove(path)
+    print(f"Embedded {len(folders)} of {len(names)} folders into {store.data_path} in {time.time() - start_time:.1f} s")
+
+
+if __name__ == '__main__':
+    main()
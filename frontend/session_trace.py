@@ -0,0 +1,354 @@
+import sys
+import json
+import time
+import argparse
+import threading
+import zipfile
+from collections import deque, Counter
+import cv2
+import numpy as np
+from logger_setup import logger
+from frame_source import FrameSource
+from bench_common import percentile_ms
+import config
+
+# Records a kiosk session (camera frames as JPEG, detections, backend requests and responses, grid
+# updates, all timed) to one zip file, and replays it with the backend answered from the trace,
+# so frame latency, time to grid update and CPU use can be compared across versions.
+# Record: set config.trace_path and run main.py
+# Replay: python session_trace.py replay session.zip [--headless] [--output run.json] [--compare base.json]
+
+TRACE_VERSION = 2
+JPEG_QUALITY = 85
+EVENTS_FILE = 'events.jsonl'
+META_FILE = 'meta.json'
+# Settings that decide the session's state path, recorded with the trace and restored for its replay
+TRACED_CONFIG = (
+    'auto_update', 'update_int', 'speculative_match', 'match_frames', 'bbox_multiplier', 'create_sprites',
+    'detection_width', 'detect_every_n', 'tracking_min_confidence', 'idle_after', 'idle_check_interval',
+    'pose_gating', 'pose_interval', 'local_matching', 'embedder', 'match_cache', 'match_cache_ttl',
+    'match_cache_tolerance', 'num_vids',
+)
+
+
+def jsonable(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (tuple, list)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: jsonable(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+class SessionTracer:
+    # One per process. Every hook is a no-op until recording or replay starts, and in replay the
+    # same events are collected in memory so both runs are measured the same way.
+    def __init__(self):
+        self.mode = None
+        self.lock = threading.Lock()
+        self.archive = None
+        self.events = []
+        self.frame_index = 0
+        self.started = None
+        self.cpu_started = None
+        self.responses = {}  # (kind, key) -> deque of recorded backend events, replay only
+        self.config = {}
+        self.stats = Counter()
+
+    def now(self):
+        return time.perf_counter() - self.started
+
+    def begin(self, mode):
+        self.mode = mode
+        self.events = []
+        self.frame_index = 0
+        self.stats.clear()
+        self.started = time.perf_counter()
+        self.cpu_started = time.process_time()
+
+    def start_recording(self, path):
+        self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED)  # JPEGs do not compress further
+        self.path = path
+        self.config = {name: getattr(config, name) for name in TRACED_CONFIG if hasattr(config, name)}
+        self.begin('record')
+        logger.info(f"Recording session trace to {path}")
+
+    def start_replay(self, events, recorded_config):
+        self.responses = {}
+        for event in events:
+            if event['type'] == 'backend':
+                self.responses.setdefault((event['kind'], event['key']), deque()).append(event)
+        for name, value in recorded_config.items():
+            setattr(config, name, value)
+        self.config = dict(recorded_config)
+        self.begin('replay')
+
+    def add(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    def frame(self, bgr, timestamp):
+        if self.mode is None:
+            return
+        with self.lock:
+            index = self.frame_index
+            self.frame_index += 1
+        event = {'type': 'frame', 't': self.now(), 'index': index}
+        if self.mode == 'record':
+            ok, jpeg = cv2.imencode('.jpg', bgr, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+            if ok:
+                with self.lock:
+                    self.archive.writestr(f"frames/{index:06d}.jpg", jpeg.tobytes())
+        self.add(event)
+
+    def detection(self, bbox, track_id):
+        if self.mode is not None:
+            self.add({'type': 'detection', 't': self.now(), 'bbox': jsonable(bbox), 'track': track_id})
+
+    def display(self, timestamp):
+        # Capture-to-display latency of one preview frame
+        if self.mode is not None and timestamp is not None:
+            self.add({'type': 'display', 't': self.now(), 'latency': time.time() - timestamp})
+
+    def match(self):
+        # new_faces handed a result to the grid
+        if self.mode is not None:
+            self.add({'type': 'match', 't': self.now()})
+
+    def grid(self):
+        # The grid's sprites are loaded and start to change
+        if self.mode is not None:
+            self.add({'type': 'grid', 't': self.now()})
+
+    def backend(self, kind, call, key):
+        # key names the request within the session (generation, purpose, count), so a replay answers
+        # each request with the response recorded for that same request
+        if self.mode is None:
+            return call()
+        if self.mode == 'replay':
+            return self.replay_backend(kind, key)
+        start = self.now()
+        result = call()
+        self.add({'type': 'backend', 'kind': kind, 'key': key, 't': start, 'latency': self.now() - start,
+                  'result': jsonable(result)})
+        return result
+
+    def replay_backend(self, kind, key):
+        # The recorded response to this request, after the recorded latency
+        with self.lock:
+            queue = self.responses.get((kind, key))
+            event = queue.popleft() if queue else None
+        start = self.now()
+        if event is None:
+            # The replay took a path the recording did not, a failed request rather than someone else's result
+            self.stats[f"{kind}_mismatched"] += 1
+            logger.warning(f"Replay: no recorded {kind} response for request {key}")
+            result = (None, None, False, None) if kind == 'match' else None
+        else:
+            time.sleep(event['latency'])
+            result = tuple(event['result']) if kind == 'match' else event['result']
+        self.add({'type': 'backend', 'kind': kind, 'key': key, 't': start, 'latency': self.now() - start})
+        return result
+
+    def stop(self):
+        if self.mode is None:
+            return None
+        if self.mode == 'record':
+            # num_vids is only set once ImageApp has laid out the grid, after recording started
+            for name in TRACED_CONFIG:
+                if name not in self.config and hasattr(config, name):
+                    self.config[name] = getattr(config, name)
+        meta = {
+            'version': TRACE_VERSION,
+            'mode': self.mode,
+            'wall_seconds': self.now(),
+            'cpu_seconds': time.process_time() - self.cpu_started,
+            'frames': self.frame_index,
+            'stats': dict(self.stats),
+            'config': self.config,
+        }
+        if self.mode == 'replay':
+            # Recorded requests the replay never made
+            for (kind, _), queue in self.responses.items():
+                meta['stats'][f"{kind}_unrequested"] = meta['stats'].get(f"{kind}_unrequested", 0) + len(queue)
+        if self.mode == 'record':
+            with self.lock:
+                self.archive.writestr(EVENTS_FILE, '\n'.join(json.dumps(event) for event in self.events))
+                self.archive.writestr(META_FILE, json.dumps(meta))
+                self.archive.close()
+                self.archive = None
+            logger.info(f"Session trace saved to {self.path}: {meta['frames']} frames, {len(self.events)} events")
+        self.mode = None
+        return meta
+
+
+tracer = SessionTracer()
+
+
+def load_trace(path):
+    with zipfile.ZipFile(path) as archive:
+        meta = json.loads(archive.read(META_FILE))
+        events = [json.loads(line) for line in archive.read(EVENTS_FILE).decode('utf-8').splitlines() if line]
+    if meta.get('version') != TRACE_VERSION:
+        raise ValueError(f"{path} is trace version {meta.get('version')}, this build reads {TRACE_VERSION}")
+    return meta, events
+
+
+class TraceFrameSource(FrameSource):
+    # The recorded frames at their recorded times, or back to back with realtime=False
+    def __init__(self, path, events, realtime=True):
+        self.archive = zipfile.ZipFile(path)
+        self.frames = deque(event for event in events if event['type'] == 'frame')
+        self.realtime = realtime
+        self.started = None
+
+    def read(self):
+        if not self.frames:
+            self.exhausted = True
+            return False, None
+        event = self.frames.popleft()
+        if self.started is None:
+            self.started = time.perf_counter() - event['t']
+        if self.realtime:
+            delay = self.started + event['t'] - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        jpeg = np.frombuffer(self.archive.read(f"frames/{event['index']:06d}.jpg"), dtype=np.uint8)
+        frame = cv2.imdecode(jpeg, cv2.IMREAD_COLOR)
+        return frame is not None, frame
+
+    def release(self):
+        self.archive.close()
+
+
+def face_to(events, kind):
+    # Seconds from a face appearing (first detection after none) to the next event of this kind
+    delays, face_since = [], None
+    for event in sorted(events, key=lambda e: e['t']):
+        if event['type'] == 'detection':
+            if event['bbox'] is None:
+                face_since = None
+            elif face_since is None:
+                face_since = event['t']
+        elif event['type'] == kind and face_since is not None:
+            delays.append(event['t'] - face_since)
+            face_since = None
+    return delays
+
+
+def summarize(meta, events):
+    display = [e['latency'] for e in events if e['type'] == 'display']
+    backend = [e['latency'] for e in events if e['type'] == 'backend']
+    to_match = face_to(events, 'match')
+    to_grid = face_to(events, 'grid')
+    wall = max(meta['wall_seconds'], 1e-6)
+    return {
+        'frames': meta['frames'],
+        'fps': meta['frames'] / wall,
+        'display_p50_ms': percentile_ms(display, 50, None),
+        'display_p95_ms': percentile_ms(display, 95, None),
+        'display_p99_ms': percentile_ms(display, 99, None),
+        'face_to_match_p50_ms': percentile_ms(to_match, 50, None),
+        'face_to_match_max_ms': max(to_match) * 1000 if to_match else None,
+        'face_to_grid_p50_ms': percentile_ms(to_grid, 50, None),
+        'face_to_grid_max_ms': max(to_grid) * 1000 if to_grid else None,
+        'matches': sum(1 for e in events if e['type'] == 'match'),
+        'backend_calls': len(backend),
+        'cpu_percent': 100.0 * meta['cpu_seconds'] / wall,
+        'mismatched_requests': sum(count for name, count in meta.get('stats', {}).items() if name.endswith('_mismatched')),
+        'unrequested_responses': sum(count for name, count in meta.get('stats', {}).items() if name.endswith('_unrequested')),
+    }
+
+
+def print_summary(summary, baseline=None):
+    for name, value in summary.items():
+        line = f"  {name:<24} {'-' if value is None else f'{value:.1f}':>10}"
+        if baseline is not None and baseline.get(name) is not None and value is not None:
+            line += f"  (baseline {baseline[name]:.1f}, {value - baseline[name]:+.1f})"
+        print(line)
+
+
+def replay_headless(path, events, realtime):
+    # Detection, new_faces and the traced backend, without Qt
+    from frame_views import Frame
+    from mediapipe_face_detection import MediaPipeFaceDetection
+    from headless_runner import drain
+    import new_faces
+
+    source = TraceFrameSource(path, events, realtime)
+    detector = MediaPipeFaceDetection()
+    grid = lambda most_similar, least_similar: None
+    while True:
+        ret, frame = source.read()
+        if source.exhausted:
+            break
+        if ret:
+            timestamp = time.time()
+            tracer.frame(frame, timestamp)
+            detector.detect_faces(Frame(frame, timestamp), grid)
+    drain(new_faces.scheduler, 30.0)
+    source.release()
+    detector.close()
+    new_faces.stop_all_threads()
+
+
+def replay_app(path, events, realtime):
+    # The full app: VideoProcessor, new_faces, ImageLoader and ImageApp, quitting when the trace ends
+    import asyncio
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtCore import QTimer
+    from image_app import ImageApp
+    from backend_communicator import preload_images
+
+    preloaded_images = asyncio.run(preload_images())
+    app = QApplication(sys.argv)
+    window = ImageApp(preloaded_images, frame_source=TraceFrameSource(path, events, realtime))
+    window.video_processor.finished.connect(lambda: QTimer.singleShot(2000, app.quit))
+    app.exec_()
+    window.video_processor.stop()
+    window.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Summarize or replay a recorded session trace')
+    parser.add_argument('command', choices=['summary', 'replay'])
+    parser.add_argument('trace')
+    parser.add_argument('--headless', action='store_true', help='Replay without Qt, detection and matching only')
+    parser.add_argument('--fast', action='store_true', help='Feed frames back to back instead of at their recorded times')
+    parser.add_argument('--output', help='Write the replay summary as JSON, to compare against later')
+    parser.add_argument('--compare', help='Summary JSON of an earlier replay to compare with')
+    args = parser.parse_args()
+
+    meta, events = load_trace(args.trace)
+    recorded = summarize(meta, events)
+    if args.command == 'summary':
+        print(f"Recorded session {args.trace}, {meta['wall_seconds']:.1f} s:")
+        print_summary(recorded)
+        return
+
+    tracer.start_replay(events, meta.get('config', {}))
+    if args.fast and config.auto_update:
+        logger.warning("Replay: periodic resets follow the wall clock, with --fast they fall at different frames than recorded")
+    if args.headless:
+        replay_headless(args.trace, events, not args.fast)
+    else:
+        replay_app(args.trace, events, not args.fast)
+    replay_meta = tracer.stop()
+    summary = summarize(replay_meta, tracer.events)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print(f"Replay of {args.trace}{' (headless)' if args.headless else ''}, {replay_meta['wall_seconds']:.1f} s:")
+    print_summary(summary, baseline)
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(summary, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+import cv2
+import threading
+from collections import deque, Counter
+from logger_setup import logger
+import config
+
+SELECTION_WINDOW = 10  # Most recent candidate frames to choose the snapshot from
+MIN_SHARPNESS = 60.0  # Laplacian variance below which a 100x100 crop is too blurry to send
+SHARPNESS_REF = 300.0  # Sharpness that counts as "half way" to a perfect score
+SIZE_REF = 0.15  # Face width (fraction of frame width) that counts as "half way"
+
+
+class Candidate:
+    def __init__(self, frame, cropped_face, bbox, confidence, sharpness, score):
+        self.frame = frame
+        self.cropped_face = cropped_face
+        self.bbox = bbox
+        self.confidence = confidence
+        self.sharpness = sharpness
+        self.score = score
+        self.frontal = None  # Head pose of the track when the frame was taken, None when not checked
+
+
+class SnapshotSelector:
+    def __init__(self, window_size=SELECTION_WINDOW):
+        self.candidates = deque(maxlen=window_size)
+        self.pose_check = None
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def score_frame(self, frame, cropped_face, bbox, confidence):
+        gray = cv2.cvtColor(cropped_face, cv2.COLOR_BGR2GRAY)
+        sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+        size = bbox[2] / frame.shape[1]
+
+        # Each term saturates towards 1 so no single one can dominate the score
+        sharpness_score = sharpness / (sharpness + SHARPNESS_REF)
+        size_score = size / (size + SIZE_REF)
+        score = confidence * (0.6 * sharpness_score + 0.4 * size_score)
+        return sharpness, score
+
+    def add(self, frame, cropped_face, bbox, confidence, track_id=None):
+        sharpness, score = self.score_frame(frame, cropped_face, bbox, confidence)
+        candidate = Candidate(frame, cropped_face, bbox, confidence, sharpness, score)
+        if config.pose_gating and self.pose_check is not None:
+            try:
+                candidate.frontal = self.pose_check(frame, bbox, track_id)
+            except Exception as e:
+                logger.exception(f"Pose check failed: {e}")
+        with self.lock:
+            self.candidates.append(candidate)
+        return candidate
+
+    def is_good(self, candidate):
+        return candidate.sharpness >= MIN_SHARPNESS
+
+    def is_frontal(self, candidate):
+        # Frames whose pose was never checked are let through
+        return candidate.frontal is not False
+
+    def has_frontal(self):
+        with self.lock:
+            return any(self.is_frontal(c) for c in self.candidates)
+
+    def select(self):
+        with self.lock:
+            if not self.candidates:
+                return None
+            latest = self.candidates[-1]
+            ranked = sorted(self.candidates, key=lambda c: c.score, reverse=True)
+
+        # Best scoring frame taken while the visitor faced the camera, the best overall if there is none
+        frontal = [c for c in ranked if self.is_frontal(c)]
+        best = frontal[0] if frontal else ranked[0]
+
+        with self.lock:
+            if not frontal:
+                self.stats['no_frontal'] += 1
+            self.stats['rejected_pose'] += ranked.index(best)
+            self.stats['selected'] += 1
+            if best is not latest:
+                self.stats['replaced_latest'] += 1
+                # The frame the old "send whatever arrived last" logic would have used was
+                # below the quality gate, so this is a likely "No face detected" avoided
+                if not self.is_good(latest) and self.is_good(best):
+                    self.stats['latest_below_quality'] += 1
+        return best
+
+    def select_many(self, count, best):
+        # best plus the next highest scoring sharp, frontal frames, for matching on a fused descriptor
+        with self.lock:
+            ranked = sorted(self.candidates, key=lambda c: c.score, reverse=True)
+        extra = [c for c in ranked if c is not best and self.is_good(c) and self.is_frontal(c)][:max(0, count - 1)]
+        with self.lock:
+            self.stats['fused_frames'] += len(extra) + 1
+        return extra
+
+    def count(self, name):
+        with self.lock:
+            self.stats[name] += 1
+
+    def clear(self):
+        with self.lock:
+            self.candidates.clear()
+
+    def log_stats(self):
+        with self.lock:
+            stats = ', '.join(f"{name}={count}" for name, count in sorted(self.stats.items()))
+        logger.info(f"Snapshot selection: {stats}")
@@ -1,4 +1,4 @@
-from PyQt5.QtCore import QTimer, QThread, pyqtSignal, Qt
+from PyQt5.QtCore import QThread, pyqtSignal, Qt
 from PyQt5.QtGui import QImage
 from mediapipe_face_detection import MediaPipeFaceDetection
 import numpy as np
@@ -8,41 +8,55 @@ from text_overlay import add_text_overlay
 import time
 import cv2
 from one_euro import OneEuroFilter  # Import the One Euro filter
+from frame_grabber import LatestFrameSlot, CaptureThread
+from frame_source import CameraSource
+from motion_gate import MotionGate, UsageMeter
+from frame_views import Frame
+from preview_channel import PreviewChannel
+from session_trace import tracer
+
+STATS_INTERVAL = 10.0  # Seconds between pipeline stats log lines
+DISPLAY_BUFFERS = 4  # Preview buffers reused round-robin, more than the in-flight, pending and in-progress frames
 
 class VideoProcessor(QThread):
     frame_ready = pyqtSignal(QImage)
 
-    def __init__(self, camera_index=0, square_size=300, callback=None):
+    def __init__(self, camera_index=0, square_size=300, callback=None, frame_source=None):
         super().__init__()
         self.camera_index = camera_index
         self.square_size = square_size
         self.face_detector = MediaPipeFaceDetection()
-        self.cap = cv2.VideoCapture(self.camera_index)
+        # Any frame_source.FrameSource, the camera unless another one is passed in
+        self.cap = frame_source if frame_source is not None else CameraSource(self.camera_index)
         self.callback = callback
         self.bbox_multiplier = config.bbox_multiplier
+        self.stopped = False
+
+        # The capture thread keeps only the newest frame in the slot, processing always takes that one
+        self.frame_slot = LatestFrameSlot()
+        self.capture_thread = None
 
         if not self.cap.isOpened():
-            logger.error("Failed to open camera.")
+            logger.error("Failed to open frame source.")
             return
 
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.process_frame)
-        self.timer.start(10)  # Adjust timer interval for better performance
-        self.setPriority(QThread.HighestPriority)
+        self.capture_thread = CaptureThread(self.cap, self.frame_slot)
 
-        self.stopped = False
-
-        # Initialize One Euro Filters for position and size
+        # Initialize One Euro Filters for position and size, only the locked face track is smoothed
         self.freq = 30.0  # Example frequency, you may need to adjust based on your application
         self.min_cutoff = .001  # Higher value for more smoothing
         self.beta = .0001       # Lower value for less reactivity to speed changes
-        self.euro_filter_cx = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
-        self.euro_filter_cy = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
-        self.euro_filter_w = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
-        self.euro_filter_h = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
+        self.euro_track_id = None
+        self.reset_euro_filters()
 
         self.last_cropped_frame = None  # Proper initialization of the attribute
 
+        # Preallocated preview buffers, the resize writes straight into them and the QImage wraps them as BGR
+        self.display_buffers = [np.empty((self.square_size, self.square_size, 3), dtype=np.uint8) for _ in range(DISPLAY_BUFFERS)]
+        self.display_index = 0
+        # At most one preview frame is queued to the GUI thread, newer ones replace the one waiting
+        self.preview = PreviewChannel(self.frame_ready)
+
         # Initialize FPS calculation
         self.prev_time = time.time()
         self.fps = 0
@@ -70,35 +84,126 @@ class VideoProcessor(QThread):
         self.bbox_buffer = []
         self.bbox_buffer_size = 10  # Increase the number of frames to consider for stability
 
-        # Timer for sending frame to backend
-        self.send_frame_timer = QTimer()
-        self.send_frame_timer.setSingleShot(True)
-        self.send_frame_timer.timeout.connect(self.send_frame_to_backend)
+        # Deadline for sending frame to backend once the bbox has been stable for a second
+        self.send_frame_deadline = None
+
+        # Capture-to-display latency
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+        self.last_stats_time = time.time()
+
+        # Idle mode: after config.idle_after seconds without a face only a cheap motion check runs,
+        # at config.idle_check_interval, until something moves in front of the camera
+        self.idle = False
+        self.last_face_time = time.time()
+        self.motion_gate = MotionGate()
+        self.usage = UsageMeter('active')
 
     def run(self):
-        self.exec_()
+        if self.capture_thread is None:
+            return
+        self.setPriority(QThread.HighestPriority)
+        self.capture_thread.start()
+        while not self.stopped:
+            if self.idle:
+                time.sleep(config.idle_check_interval)
+            frame, timestamp = self.frame_slot.take(timeout=0.1)
+            if self.stopped:
+                break
+            if frame is None and self.cap.exhausted:
+                logger.info("Frame source exhausted, video processing stopped.")
+                break
+            # A frame that waited for the GUI to finish painting goes out as soon as it has
+            self.preview.flush()
+            if frame is None:
+                # Nothing captured within the timeout, not a frame without a face
+                continue
+            tracer.frame(frame, timestamp)
+            frame = Frame(frame, timestamp)
+
+            if self.idle and not self.motion_gate.check(frame):
+                self.show_last_position(frame.bgr, timestamp)
+            else:
+                if self.idle:
+                    self.leave_idle()
+                self.process_frame(frame, timestamp)
+                if time.time() - self.last_face_time >= config.idle_after:
+                    self.enter_idle()
+
+            if self.send_frame_deadline is not None and time.time() >= self.send_frame_deadline:
+                self.send_frame_deadline = None
+                self.send_frame_to_backend()
 
-    
-    def process_frame(self):
+            if time.time() - self.last_stats_time >= STATS_INTERVAL:
+                self.log_pipeline_stats()
+
+    def reset_euro_filters(self):
+        self.euro_filter_cx = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
+        self.euro_filter_cy = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
+        self.euro_filter_w = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
+        self.euro_filter_h = OneEuroFilter(self.freq, min_cutoff=self.min_cutoff, beta=self.beta)
+
+    def enter_idle(self):
+        logger.info(f"No face for {config.idle_after} s, entering idle mode.")
+        self.idle = True
+        self.motion_gate.reset()
+        self.usage.switch('idle')
+        self.usage.report()
+
+    def leave_idle(self):
+        logger.info("Motion detected, resuming full-rate detection.")
+        self.idle = False
+        self.last_face_time = time.time()
+        self.usage.switch('active')
+        self.usage.report()
+
+    def emit_frame(self, q_img, timestamp):
+        self.preview.offer(q_img)
+        tracer.display(timestamp)
+        if timestamp is not None:
+            latency = time.time() - timestamp
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latency_count += 1
+
+    def log_pipeline_stats(self):
+        avg_latency = self.latency_total / self.latency_count if self.latency_count else 0.0
+        logger.info(f"Video pipeline: captured={self.frame_slot.captured}, dropped={self.frame_slot.dropped}, "
+                    f"read failures={self.capture_thread.read_failures}, "
+                    f"capture-to-display avg={avg_latency * 1000:.1f} ms, max={self.latency_max * 1000:.1f} ms")
+        preview = self.preview.take_stats()
+        elapsed = max(time.time() - self.last_stats_time, 1e-6)
+        logger.info(f"Preview: {preview.get('painted', 0) / elapsed:.1f} fps painted, offered={preview.get('offered', 0)}, "
+                    f"coalesced={preview.get('coalesced', 0)}, ack timeouts={preview.get('ack_timeouts', 0)}, "
+                    f"paint round trip={preview['paint_ms']:.1f} ms")
+        self.face_detector.log_stats()
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+        self.last_stats_time = time.time()
+
+    def process_frame(self, frame, timestamp=None):
         if self.stopped:
             return
 
         try:
-            ret, frame = self.cap.read()
-            if not ret or frame is None or frame.size == 0:
+            if frame is None:
                 if config.show_saved_frame and self.saved_frame is not None:
                     resized_frame = self.resize_to_square(self.saved_frame, self.square_size)
                     add_text_overlay(resized_frame)
                     self.display_fps(resized_frame)
                     q_img = self.convert_to_qimage(resized_frame)
-                    self.frame_ready.emit(q_img)
+                    self.emit_frame(q_img, timestamp)
                 else:
                     logger.error("No valid frame available.")
                 return
 
-            original_frame = frame.copy()
+            # Detection never draws on the frame, so the preview crops from it directly
+            original_frame = frame.bgr
             frame, bbox = self.face_detector.detect_faces(frame, self.callback)
             if bbox:
+                self.last_face_time = time.time()
                 x, y, w, h = bbox
                 cx, cy = x + w // 2, y + h // 2
 
@@ -118,7 +223,11 @@ class VideoProcessor(QThread):
                     w = int(w * self.bbox_multiplier)
                     h = int(h * self.bbox_multiplier)
 
-                    # Apply One Euro filter
+                    # Apply One Euro filter, a new track starts from its own box instead of gliding from the last face
+                    track_id = self.face_detector.face_tracker.locked_id
+                    if track_id != self.euro_track_id:
+                        self.euro_track_id = track_id
+                        self.reset_euro_filters()
                     current_time = time.time()
                     filtered_cx = self.euro_filter_cx.filter(cx, current_time)
                     filtered_cy = self.euro_filter_cy.filter(cy, current_time)
@@ -143,7 +252,7 @@ class VideoProcessor(QThread):
                     q_img = self.convert_to_qimage(resized_frame)
 
                     # Emit the frame ready signal
-                    self.frame_ready.emit(q_img)
+                    self.emit_frame(q_img, timestamp)
 
                     # Add the current bounding box center to the buffer
                     self.bbox_buffer.append((filtered_cx, filtered_cy))
@@ -152,34 +261,37 @@ class VideoProcessor(QThread):
 
                     # Check if the bounding box is stable
                     if self.is_bbox_stable():
-                        if not self.send_frame_timer.isActive():
-                            self.send_frame_timer.start(1000)  # Wait for 1 second before sending
+                        if self.send_frame_deadline is None:
+                            self.send_frame_deadline = time.time() + 1.0  # Wait for 1 second before sending
 
                     self.no_face_counter = 0
 
             else:
                 self.no_face_counter += 1
                 if self.no_face_counter >= self.no_face_threshold:
-                    if self.last_cropped_frame is not None and self.last_cropped_position is not None:
-                        filtered_cx, filtered_cy, filtered_w, filtered_h = self.last_cropped_position
-                        cropped_frame = self.extract_frame(original_frame, filtered_w, filtered_h, filtered_cx, filtered_cy)
-                        resized_frame = self.resize_to_square(cropped_frame, self.square_size)
-
-                        add_text_overlay(resized_frame, text="Live")
-                        self.display_fps(resized_frame)
-                        q_img = self.convert_to_qimage(resized_frame)
-                        self.frame_ready.emit(q_img)
-                    else:
-                        if config.show_saved_frame and self.saved_frame is not None:
-                            resized_frame = self.resize_to_square(self.saved_frame, self.square_size)
-                            add_text_overlay(resized_frame)
-                            self.display_fps(resized_frame)
-                            q_img = self.convert_to_qimage(resized_frame)
-                            self.frame_ready.emit(q_img)
+                    self.show_last_position(original_frame, timestamp)
 
         except Exception as e:
             logger.exception(f"Error processing frame: {e}")
 
+    def show_last_position(self, frame, timestamp):
+        if self.last_cropped_frame is not None and self.last_cropped_position is not None:
+            filtered_cx, filtered_cy, filtered_w, filtered_h = self.last_cropped_position
+            cropped_frame = self.extract_frame(frame, filtered_w, filtered_h, filtered_cx, filtered_cy)
+            resized_frame = self.resize_to_square(cropped_frame, self.square_size)
+
+            add_text_overlay(resized_frame, text="Live")
+            self.display_fps(resized_frame)
+            q_img = self.convert_to_qimage(resized_frame)
+            self.emit_frame(q_img, timestamp)
+        else:
+            if config.show_saved_frame and self.saved_frame is not None:
+                resized_frame = self.resize_to_square(self.saved_frame, self.square_size)
+                add_text_overlay(resized_frame)
+                self.display_fps(resized_frame)
+                q_img = self.convert_to_qimage(resized_frame)
+                self.emit_frame(q_img, timestamp)
+
     def is_bbox_stable(self):
         if len(self.bbox_buffer) < self.bbox_buffer_size:
             return False
@@ -229,12 +341,18 @@ class VideoProcessor(QThread):
         return frame[y1:y2, x1:x2]
 
     def resize_to_square(self, frame, size):
-        return cv2.resize(frame, (size, size), interpolation=cv2.INTER_LINEAR)
+        if size != self.square_size:
+            return cv2.resize(frame, (size, size), interpolation=cv2.INTER_LINEAR)
+        buffer = self.display_buffers[self.display_index]
+        self.display_index = (self.display_index + 1) % len(self.display_buffers)
+        cv2.resize(frame, (size, size), dst=buffer, interpolation=cv2.INTER_LINEAR)
+        return buffer
 
     def convert_to_qimage(self, frame):
-        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        q_img = QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_RGB888)
-        return q_img
+        # No color conversion or copy, the QImage reads the BGR display buffer in place. The preview
+        # channel holds one frame in flight and one pending, so with the one being drawn the ring of
+        # DISPLAY_BUFFERS never rewrites a buffer the GUI can still see.
+        return QImage(frame.data, frame.shape[1], frame.shape[0], frame.strides[0], QImage.Format_BGR888)
 
     def display_fps(self, frame):
         current_time = time.time()
@@ -256,10 +374,17 @@ class VideoProcessor(QThread):
     def stop(self):
         print("VideoProcessor: Stopping")
         self.stopped = True
-        self.timer.stop()
-        self.cap.release()
+        # The loop may be inside process_frame, the detector and frame source stay open until it exits
         self.quit()
         self.wait()
+        if self.capture_thread is not None:
+            self.usage.report()
+            self.capture_thread.stop()
+            if self.capture_thread.is_alive():
+                self.capture_thread.join(timeout=1.0)
+        self.frame_slot.close()
+        self.face_detector.close()
+        self.cap.release()
 
     def update_config(self):
         self.bbox_multiplier = config.bbox_multiplier